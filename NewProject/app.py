@@ -1,30 +1,91 @@
-from typing import Optional, Dict, List
+import base64
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import chain, islice
+from typing import Any, Optional, Dict, List, Iterable, Iterator
 from pathlib import Path
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Request, Body, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from starlette.requests import ClientDisconnect
 from pydantic import BaseModel
+from sqlalchemy import or_, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from s import search_disease, read_excel_smart, prepare_merged
-from db import init_db, get_db, User, LookupLog
+from s import (
+    search_with_index, build_search_index, iter_table_rows, list_codes, lookup_code, normalize_text, read_excel_smart,
+    prepare_merged
+)
+from serialization import FastJSONResponse, dumps
+from search_pool import SearchPool
+from compression import CompressionMiddleware
+from metrics import MetricsMiddleware, render_metrics, CACHE_REQUESTS, STARTUP_DURATION
+from fhir_validation import VALIDATORS, BundleError, check_transaction_bundle, warm_up_models
+from fhir_processing import (
+    InvalidResource, add_condition_codings, process_bundle_entry, process_entries, storage_rows,
+    uncoded_condition_texts
+)
+from lookup_cache import LookupCache
+from entry_pool import EntryPool
+from terminology import (
+    CONCEPT_MAP_ID, UnknownSystem, build_concept_map, expand_value_set, lookup_concept, translate_concept,
+    translate_parameters, validate_code
+)
+from fhir_stream import iter_bundle_entries
+from fhir_summary import ResponseShape, render_transaction_response
+from db import init_db, get_db, SessionLocal, User, LookupLog, FHIRResource, store_fhir_resources
 from fhir_mapping import map_to_fhir_patient, map_to_fhir_observation, map_to_fhir_condition
-from fhir.resources.bundle import Bundle, BundleEntry, BundleEntryResponse
-from fhir.resources.patient import Patient
-from fhir.resources.observation import Observation
-import json
-from fhir.resources.operationoutcome import OperationOutcome, OperationOutcomeIssue
 
 # Initialize these as None first
 siddha_df = None
 unani_df = None
 merged_df = None
+search_index = None
+concept_map = None
+search_pool = None
+# Opt-in: validate sample resources at startup (and in each FHIR worker process as
+# it starts) so the first /fhir_resource request doesn't pay for building validators
+FHIR_WARMUP = os.getenv("FHIR_WARMUP", "").strip().lower() in ("1", "true", "yes")
+
+entry_pool = EntryPool(initializer=warm_up_models if FHIR_WARMUP else None)
+lookup_cache = LookupCache()
 
 # Will load these when needed
 SIDDHA_PATH = Path(r"C:/Users/DY15D/OneDrive/Desktop/NewProject/NewProject/NATIONAL SIDDHA MORBIDITY CODES.xls")
 UNANI_PATH  = Path(r"C:/Users/DY15D/OneDrive/Desktop/NewProject/NewProject/NATIONAL UNANI MORBIDITY CODES.xls")
 MERGED_PATH = Path(r"C:/Users/DY15D/OneDrive/Desktop/NewProject/NewProject/merged_dataset.xlsx")
 
+# Worker processes for search; 0 keeps searching in the API process's thread pool
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "0"))
+
+# How long browsers/CDNs may reuse a GET /lookup response before revalidating
+LOOKUP_CACHE_MAX_AGE = int(os.getenv("LOOKUP_CACHE_MAX_AGE", "3600"))
+
+# Page size limits for GET /codes
+CODES_DEFAULT_LIMIT = 100
+CODES_MAX_LIMIT = 1000
+DISCIPLINES = {"siddha": "Siddha", "unani": "Unani"}
+OTHER_DISCIPLINE = {"Siddha": "Unani", "Unani": "Siddha"}
+
+# Rows read from an uploaded diagnosis file per search batch
+BULK_LOOKUP_CHUNK_SIZE = int(os.getenv("BULK_LOOKUP_CHUNK_SIZE", "200"))
+# Column names tried, in order, when /lookup/bulk is not told which column to code
+DIAGNOSIS_COLUMNS = ("disease_text", "diagnosis", "disease", "text")
+
+# Rows inserted per transaction by the bulk user endpoints
+BULK_USER_CHUNK_SIZE = int(os.getenv("BULK_USER_CHUNK_SIZE", "500"))
+
 app = FastAPI(title="AYUSH Lookup API")
 
 app.add_middleware(
@@ -34,36 +95,152 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(
+    CompressionMiddleware,
+    paths=("/fhir_resource", "/profile", "/$export"),
+    minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")),
+)
+app.add_middleware(MetricsMiddleware)
+
+@contextmanager
+def startup_stage(name: str, timings: Dict[str, float]):
+    """Times one startup stage into `timings` and the startup_stage_duration_seconds gauge."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - started
+        STARTUP_DURATION.labels(name).set(timings[name])
 
 @app.on_event("startup")
 def on_startup():
     """Initializes the database and loads data files on application startup."""
-    global siddha_df, unani_df, merged_df
-    init_db()
-    
+    global siddha_df, unani_df, merged_df, search_index, concept_map, search_pool
+    timings: Dict[str, float] = {}
+    with startup_stage("init_db", timings):
+        init_db()
+
     print("Loading data files...")
-    if SIDDHA_PATH.exists():
-        siddha_df = read_excel_smart(SIDDHA_PATH)
-        print("Siddha data loaded successfully.")
-    else:
-        print(f"Warning: Siddha data file not found at {SIDDHA_PATH}")
+    with startup_stage("load_data", timings):
+        if SIDDHA_PATH.exists():
+            siddha_df = read_excel_smart(SIDDHA_PATH)
+            print("Siddha data loaded successfully.")
+        else:
+            print(f"Warning: Siddha data file not found at {SIDDHA_PATH}")
 
-    if UNANI_PATH.exists():
-        unani_df = read_excel_smart(UNANI_PATH)
-        print("Unani data loaded successfully.")
-    else:
-        print(f"Warning: Unani data file not found at {UNANI_PATH}")
+        if UNANI_PATH.exists():
+            unani_df = read_excel_smart(UNANI_PATH)
+            print("Unani data loaded successfully.")
+        else:
+            print(f"Warning: Unani data file not found at {UNANI_PATH}")
 
-    if MERGED_PATH.exists():
-        merged_df = prepare_merged(read_excel_smart(MERGED_PATH))
-        print("Merged data loaded successfully.")
+        if MERGED_PATH.exists():
+            merged_df = prepare_merged(read_excel_smart(MERGED_PATH))
+            print("Merged data loaded successfully.")
+        else:
+            print(f"Warning: Merged data file not found at {MERGED_PATH}")
+
+    if siddha_df is not None and unani_df is not None:
+        with startup_stage("search_index", timings):
+            search_index = build_search_index(siddha_df, unani_df, merged_df)
+            print("Search index built successfully.")
+            concept_map = build_concept_map(search_index)
+            print(f"ConceptMap compiled with {len(concept_map.matches)} source codes.")
+
+        if SEARCH_WORKERS > 0:
+            with startup_stage("search_pool", timings):
+                search_pool = SearchPool(search_index, SEARCH_WORKERS)
+            print(f"Search pool started with {SEARCH_WORKERS} worker processes.")
+
+    if FHIR_WARMUP:
+        with startup_stage("fhir_warmup", timings):
+            models = warm_up_models()
+        print("FHIR models warmed up: " + ", ".join(f"{k} {v * 1000:.1f}ms" for k, v in models.items()))
+
+    print("Startup timing: " + ", ".join(f"{k} {v:.3f}s" for k, v in timings.items())
+          + f" (total {sum(timings.values()):.3f}s)")
+
+@app.on_event("shutdown")
+def on_shutdown():
+    if search_pool is not None:
+        search_pool.shutdown()
+    entry_pool.shutdown()
+
+def get_search_index():
+    if search_index is None:
+        raise HTTPException(status_code=503, detail="Search data is not loaded")
+    return search_index
+
+def get_concept_map():
+    if concept_map is None:
+        raise HTTPException(status_code=503, detail="Search data is not loaded")
+    return concept_map
+
+async def run_search(text: str, fuzzy_top_k: int = 5, fuzzy_threshold: int = 85) -> Dict:
+    """
+    Runs one search on the process pool if enabled, otherwise in the thread pool.
+    Results are served from and stored in the shared lookup cache.
+    """
+    index = get_search_index()
+    key = LookupCache.key(index.version, normalize_text(text), fuzzy_top_k, fuzzy_threshold)
+    out = lookup_cache.get(key)
+    if out is not None:
+        return out
+    if search_pool is not None:
+        out = await search_pool.search(text, fuzzy_top_k=fuzzy_top_k, fuzzy_threshold=fuzzy_threshold)
     else:
-        print(f"Warning: Merged data file not found at {MERGED_PATH}")
+        out = await run_in_threadpool(
+            search_with_index, index, text, fuzzy_top_k=fuzzy_top_k, fuzzy_threshold=fuzzy_threshold
+        )
+    lookup_cache.put(key, out)
+    return out
+
+def search_texts(texts: Iterable[str], fuzzy_top_k: int = 5, fuzzy_threshold: int = 85) -> Dict[str, Dict]:
+    """
+    Blocking batch search through the shared lookup cache. Texts are deduplicated on
+    their normalized form and all cache misses are searched in one batched call.
+    Returns text -> result for every non-empty text.
+    """
+    index = get_search_index()
+    keys = {t: LookupCache.key(index.version, normalize_text(t), fuzzy_top_k, fuzzy_threshold) for t in texts}
+    found: Dict[tuple, Dict] = {}
+    missing: Dict[tuple, str] = {}
+    for text, key in keys.items():
+        if not key[1] or key in found or key in missing:
+            continue
+        out = lookup_cache.get(key)
+        if out is None:
+            missing[key] = text
+        else:
+            found[key] = out
+
+    if missing:
+        unique = list(missing.values())
+        if search_pool is not None:
+            results = search_pool.search_many(unique, fuzzy_top_k=fuzzy_top_k, fuzzy_threshold=fuzzy_threshold)
+        else:
+            results = [
+                search_with_index(index, t, fuzzy_top_k=fuzzy_top_k, fuzzy_threshold=fuzzy_threshold) for t in unique
+            ]
+        for key, out in zip(missing, results):
+            lookup_cache.put(key, out)
+            found[key] = out
+    return {text: found[key] for text, key in keys.items() if key in found}
+
+def autocode_conditions(entries: List[Dict]):
+    """Adds NAMC/NUMC codings to Conditions that only carry code.text, with one batched search."""
+    texts = uncoded_condition_texts(entries)
+    if texts and search_index is not None:
+        add_condition_codings(entries, search_texts(texts))
 
 class UserCreate(BaseModel):
     username: str
     email: Optional[str] = None
 
+class BulkUserResponse(BaseModel):
+    created: List[Dict]
+    conflicts: List[Dict]
+
 class UserLogin(BaseModel):
     username: str
 
@@ -77,6 +254,14 @@ class LookupResponse(BaseModel):
     user_id: Optional[int] = None
     result: Dict
 
+class CodeBatchRequest(BaseModel):
+    discipline: str
+    codes: List[str]
+
+class TranslateRequest(BaseModel):
+    source: str
+    codes: List[str]
+
 class ProfileResponse(BaseModel):
     user_id: int
     username: str
@@ -92,6 +277,11 @@ class SaveLookupRequest(BaseModel):
 def root():
     return {"message": "AYUSH Lookup API running. Check /docs"}
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint."""
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.post("/users", response_model=Dict)
 def create_user(user: UserCreate, db: Session = Depends(get_db)):
     new_user = User(username=user.username, email=user.email)
@@ -100,6 +290,109 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
     db.refresh(new_user)
     return {"id": new_user.id, "username": new_user.username, "email": new_user.email}
 
+def _chunked(items: Iterable, size: int) -> Iterator[List]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _insert_user_chunk(db: Session, chunk: List[tuple], seen: Dict[str, set]) -> tuple:
+    """
+    Inserts one chunk of (row_number, UserCreate) pairs in a single transaction.
+    Rows clashing on username/email with the database or with earlier rows of the
+    same batch are reported as conflicts instead of aborting the chunk.
+    """
+    usernames = [u.username for _, u in chunk]
+    emails = [u.email for _, u in chunk if u.email]
+    taken_usernames, taken_emails = set(), set()
+    for username, email in db.query(User.username, User.email).filter(
+        or_(User.username.in_(usernames), User.email.in_(emails))
+    ):
+        taken_usernames.add(username)
+        if email:
+            taken_emails.add(email)
+
+    conflicts, pending = [], []
+    for row, user in chunk:
+        if not user.username:
+            conflicts.append({"row": row, "username": user.username, "field": "username",
+                              "detail": "username is required"})
+            continue
+        if user.username in taken_usernames or user.username in seen["username"]:
+            conflicts.append({"row": row, "username": user.username, "field": "username",
+                              "detail": "username already exists"})
+            continue
+        if user.email and (user.email in taken_emails or user.email in seen["email"]):
+            conflicts.append({"row": row, "username": user.username, "field": "email",
+                              "detail": "email already exists"})
+            continue
+        seen["username"].add(user.username)
+        if user.email:
+            seen["email"].add(user.email)
+        pending.append((row, User(username=user.username, email=user.email)))
+
+    try:
+        db.add_all([u for _, u in pending])
+        db.commit()
+    except IntegrityError:
+        # A concurrent writer won a race on one of the rows; retry row by row so
+        # only the offending rows are reported.
+        db.rollback()
+        inserted = []
+        for row, new_user in pending:
+            new_user = User(username=new_user.username, email=new_user.email)
+            try:
+                with db.begin_nested():
+                    db.add(new_user)
+            except IntegrityError as e:
+                conflicts.append({"row": row, "username": new_user.username, "field": None,
+                                  "detail": str(e.orig)})
+                continue
+            inserted.append((row, new_user))
+        db.commit()
+        pending = inserted
+
+    created = [{"row": row, "id": u.id, "username": u.username, "email": u.email} for row, u in pending]
+    return created, conflicts
+
+def _bulk_create_users(db: Session, users: Iterable[UserCreate]) -> Dict:
+    created, conflicts = [], []
+    seen = {"username": set(), "email": set()}
+    for chunk in _chunked(enumerate(users), BULK_USER_CHUNK_SIZE):
+        chunk_created, chunk_conflicts = _insert_user_chunk(db, chunk, seen)
+        created.extend(chunk_created)
+        conflicts.extend(chunk_conflicts)
+    return {"created": created, "conflicts": conflicts}
+
+@app.post("/users/bulk", response_model=BulkUserResponse)
+def create_users_bulk(users: List[UserCreate], db: Session = Depends(get_db)):
+    """
+    Creates many users at once, committing one transaction per chunk.
+    Conflicts on username/email are reported per row; the rest of the batch is kept.
+    """
+    return _bulk_create_users(db, users)
+
+@app.post("/users/bulk/csv", response_model=BulkUserResponse)
+def create_users_bulk_csv(file: UploadFile = File(...), db: Session = Depends(get_db)):
+    """
+    Same as /users/bulk but reads users from an uploaded CSV with a
+    `username` column and an optional `email` column.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(file.file, encoding="utf-8-sig"))
+    if not reader.fieldnames or "username" not in [f.strip().lower() for f in reader.fieldnames]:
+        raise HTTPException(status_code=400, detail="CSV must have a 'username' column")
+
+    def rows():
+        for raw in reader:
+            record = {(k or "").strip().lower(): (v or "").strip() for k, v in raw.items()}
+            yield UserCreate(username=record.get("username", ""), email=record.get("email") or None)
+
+    return _bulk_create_users(db, rows())
+
 @app.post("/login", response_model=Dict)
 def login_user(user: UserLogin, db: Session = Depends(get_db)):
     db_user = db.query(User).filter(User.username == user.username).first()
@@ -109,17 +402,14 @@ def login_user(user: UserLogin, db: Session = Depends(get_db)):
     return {"id": db_user.id, "username": db_user.username, "email": db_user.email}
 
 
-@app.post("/lookup", response_model=LookupResponse)
-def lookup(req: LookupRequest, db: Session = Depends(get_db)):
+@app.post("/lookup", response_model=LookupResponse, response_class=FastJSONResponse)
+async def lookup(req: LookupRequest, db: Session = Depends(get_db)):
     text = (req.disease_text or "").strip()
     if not text:
         raise HTTPException(status_code=400, detail="disease_text is required")
 
-    out = search_disease(
+    out = await run_search(
         text,
-        siddha_df=siddha_df,
-        unani_df=unani_df,
-        merged_df=merged_df,
         fuzzy_top_k=req.fuzzy_top_k,
         fuzzy_threshold=req.fuzzy_threshold,
     )
@@ -129,7 +419,309 @@ def lookup(req: LookupRequest, db: Session = Depends(get_db)):
     # db.commit()
     # db.refresh(log)
 
-    return {"user_id": req.user_id, "result": out}
+    # Returned as a Response so FastAPI skips re-validating the free-form result
+    return FastJSONResponse({"user_id": req.user_id, "result": out})
+
+def _lookup_etag(version: str, q_norm: str, threshold: int, top_k: int) -> str:
+    key = f"{version}|{q_norm}|{threshold}|{top_k}".encode("utf-8")
+    return '"' + hashlib.sha256(key).hexdigest()[:32] + '"'
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [t.strip() for t in if_none_match.split(",")]
+    # If-None-Match uses weak comparison, so W/"x" matches "x"
+    return "*" in candidates or etag in [c[2:] if c.startswith("W/") else c for c in candidates]
+
+@app.get("/lookup", response_model=LookupResponse, response_class=FastJSONResponse)
+async def lookup_get(request: Request, q: str, threshold: int = 85, top_k: int = 5):
+    """
+    Cacheable variant of POST /lookup. The ETag is derived from the dataset
+    version and the normalized query, so a conditional request is answered
+    with 304 without running the search.
+    """
+    q_norm = normalize_text(q)
+    if not q_norm:
+        raise HTTPException(status_code=400, detail="q is required")
+    index = get_search_index()
+
+    etag = _lookup_etag(index.version, q_norm, threshold, top_k)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={LOOKUP_CACHE_MAX_AGE}",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        CACHE_REQUESTS.labels("lookup_etag", "hit").inc()
+        return Response(status_code=304, headers=headers)
+    CACHE_REQUESTS.labels("lookup_etag", "miss").inc()
+
+    out = await run_search(q, fuzzy_top_k=top_k, fuzzy_threshold=threshold)
+    if out.get("fuzzy_skipped"):
+        # Degraded answer under load; don't let caches keep it
+        headers = {"Cache-Control": "no-store"}
+    return FastJSONResponse({"user_id": None, "result": out}, headers=headers)
+
+def _encode_cursor(discipline: str, code: str) -> str:
+    raw = dumps([discipline, code])
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor: str, discipline: str) -> str:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_discipline, code = json.loads(raw)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_discipline != discipline:
+        raise HTTPException(status_code=400, detail="Cursor belongs to a different discipline")
+    return str(code)
+
+def get_discipline(discipline: str) -> str:
+    name = DISCIPLINES.get((discipline or "").strip().lower())
+    if name is None:
+        raise HTTPException(status_code=400, detail="discipline must be 'siddha' or 'unani'")
+    return name
+
+@app.get("/codes", response_class=FastJSONResponse)
+def browse_codes(discipline: str, prefix: str = "", cursor: Optional[str] = None, limit: int = CODES_DEFAULT_LIMIT):
+    """
+    Pages through a discipline's code table in code order. Cursors are keyed on the
+    last code returned, so pages stay stable while partners sync incrementally.
+    """
+    name = get_discipline(discipline)
+    if not 1 <= limit <= CODES_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {CODES_MAX_LIMIT}")
+    after = _decode_cursor(cursor, name) if cursor else None
+
+    items, last_code = list_codes(get_search_index(), name, prefix=prefix.strip(), after=after, limit=limit)
+    return FastJSONResponse({
+        "discipline": name,
+        "version": get_search_index().version,
+        "items": items,
+        "next_cursor": _encode_cursor(name, last_code) if last_code is not None else None,
+    })
+
+@app.get("/code/{discipline}/{code}", response_class=FastJSONResponse)
+def get_code(discipline: str, code: str):
+    """Resolves a NAMC/NUMC code to its label and merged crosswalk."""
+    record = lookup_code(get_search_index(), get_discipline(discipline), code)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Code '{code}' not found")
+    return FastJSONResponse(record)
+
+@app.post("/code/bulk", response_class=FastJSONResponse)
+def get_codes_bulk(req: CodeBatchRequest):
+    """Resolves many codes of one discipline at once; unknown codes are listed in not_found."""
+    index = get_search_index()
+    name = get_discipline(req.discipline)
+    results, not_found = {}, []
+    for code in dict.fromkeys(req.codes):
+        record = lookup_code(index, name, code)
+        if record is None:
+            not_found.append(code)
+        else:
+            results[code] = record
+    return FastJSONResponse({"discipline": name, "results": results, "not_found": not_found})
+
+@app.get("/translate/{discipline}/{code}", response_class=FastJSONResponse)
+def translate_code(discipline: str, code: str):
+    """Returns the equivalent codes of the other discipline from the merged crosswalk."""
+    source = get_discipline(discipline)
+    targets = get_search_index().crosswalk.get((source, code.strip()))
+    if not targets:
+        raise HTTPException(status_code=404, detail=f"No {OTHER_DISCIPLINE[source]} mapping for code '{code}'")
+    return FastJSONResponse({"source": source, "target": OTHER_DISCIPLINE[source], "code": code, "equivalents": targets})
+
+@app.post("/translate", response_class=FastJSONResponse)
+def translate_codes(req: TranslateRequest):
+    """Batch Siddha<->Unani translation; codes without a mapping are listed in unmapped."""
+    source = get_discipline(req.source)
+    crosswalk = get_search_index().crosswalk
+    translations, unmapped = {}, []
+    for code in dict.fromkeys(req.codes):
+        targets = crosswalk.get((source, code.strip()))
+        if targets:
+            translations[code] = targets
+        else:
+            unmapped.append(code)
+    return FastJSONResponse({
+        "source": source,
+        "target": OTHER_DISCIPLINE[source],
+        "translations": translations,
+        "unmapped": unmapped,
+    })
+
+@app.get("/CodeSystem/$lookup", response_class=FastJSONResponse)
+def codesystem_lookup(system: str, code: str):
+    """FHIR CodeSystem/$lookup for NAMC/NUMC codes, answered from the search index."""
+    try:
+        params = lookup_concept(get_search_index(), system, code)
+    except UnknownSystem as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if params is None:
+        raise HTTPException(status_code=404, detail=f"Code '{code}' not found in '{system}'")
+    return FastJSONResponse(params)
+
+@app.get("/ValueSet/$expand", response_class=FastJSONResponse)
+def valueset_expand(url: str, filter: str = "", offset: int = 0, count: int = CODES_DEFAULT_LIMIT):
+    """
+    FHIR ValueSet/$expand with `filter` text search. Each filtered expansion is built
+    once and cached, so further pages of a pick-list are plain slices.
+    """
+    if offset < 0 or not 1 <= count <= CODES_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"offset must be >= 0 and count between 1 and {CODES_MAX_LIMIT}")
+    try:
+        return FastJSONResponse(expand_value_set(get_search_index(), url, filter.strip(), offset, count))
+    except UnknownSystem as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/CodeSystem/$validate-code", response_class=FastJSONResponse)
+def codesystem_validate_code(url: str, code: str, display: Optional[str] = None):
+    """FHIR CodeSystem/$validate-code; `url` is the code system."""
+    try:
+        return FastJSONResponse(validate_code(get_search_index(), url, code, display))
+    except UnknownSystem as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/ValueSet/$validate-code", response_class=FastJSONResponse)
+def valueset_validate_code(url: str, system: str, code: str, display: Optional[str] = None):
+    """FHIR ValueSet/$validate-code; `url` is the value set and `system` the code's code system."""
+    try:
+        return FastJSONResponse(validate_code(get_search_index(), system, code, display, value_set=url))
+    except UnknownSystem as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get(f"/ConceptMap/{CONCEPT_MAP_ID}", response_class=FastJSONResponse)
+def get_concept_map_resource():
+    """The Siddha<->Unani ConceptMap compiled from the merged dataset at startup."""
+    return FastJSONResponse(get_concept_map().resource)
+
+@app.get("/ConceptMap/$translate", response_class=FastJSONResponse)
+def conceptmap_translate(sourceSystem: str, sourceCode: str, targetSystem: Optional[str] = None):
+    """FHIR ConceptMap/$translate for one code; answered from the precompiled map."""
+    try:
+        return FastJSONResponse(translate_concept(get_concept_map(), sourceSystem, sourceCode, targetSystem))
+    except UnknownSystem as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/ConceptMap/$translate", response_class=FastJSONResponse)
+def conceptmap_translate_batch(params: Dict[str, Any] = Body(...)):
+    """
+    FHIR ConceptMap/$translate with a Parameters body. Repeating sourceCoding translates
+    a whole batch in one call, with one `translation` parameter per input coding.
+    """
+    try:
+        return FastJSONResponse(translate_parameters(get_concept_map(), params))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+BULK_CSV_FIELDS = ["row", "disease_text", "match", "discipline", "code", "label", "score"]
+
+def _flatten_result(row: int, text: str, out: Dict) -> Dict:
+    if "code" in out:
+        return {"row": row, "disease_text": text, "match": "matched", "discipline": out["discipline"],
+                "code": out["code"], "label": out["label"], "score": ""}
+    if out.get("suggestions"):
+        top = out["suggestions"][0]
+        return {"row": row, "disease_text": text, "match": "fuzzy", "discipline": top["discipline"],
+                "code": top["code"], "label": top["label"], "score": top["score"]}
+    if out.get("fuzzy_skipped"):
+        return {"row": row, "disease_text": text, "match": "fuzzy_skipped", "discipline": "", "code": "",
+                "label": "", "score": ""}
+    if out.get("search_failed"):
+        return {"row": row, "disease_text": text, "match": "error", "discipline": "", "code": "",
+                "label": "", "score": ""}
+    return {"row": row, "disease_text": text, "match": "none", "discipline": "", "code": "", "label": "", "score": ""}
+
+def _code_rows(rows: Iterator[Dict[str, str]], column: str, top_k: int, threshold: int) -> Iterator[tuple]:
+    """
+    Runs uploaded rows through the search engine a chunk at a time, yielding
+    (row_number, text, result). Repeated texts are searched once, through the
+    lookup cache shared with /lookup.
+
+    The response has already started, so a failing search cannot become an HTTP
+    error: the chunk is retried one text at a time and each text that still fails
+    gets an error result, while the rest of the file keeps streaming.
+    """
+    row_number = 0
+    while True:
+        chunk = list(islice(rows, BULK_LOOKUP_CHUNK_SIZE))
+        if not chunk:
+            return
+        texts = [(r.get(column) or "").strip() for r in chunk]
+        try:
+            results = search_texts(texts, fuzzy_top_k=top_k, fuzzy_threshold=threshold)
+        except Exception:
+            results = {}
+            for text in dict.fromkeys(texts):
+                try:
+                    results.update(search_texts([text], fuzzy_top_k=top_k, fuzzy_threshold=threshold))
+                except Exception as e:
+                    results[text] = {"error": f"Search failed: {e}", "search_failed": True}
+        for text in texts:
+            yield row_number, text, results.get(text, {"error": "Empty diagnosis text"})
+            row_number += 1
+
+@app.post("/lookup/bulk")
+def lookup_bulk(
+    file: UploadFile = File(...),
+    column: Optional[str] = None,
+    format: str = "ndjson",
+    fuzzy_threshold: int = 85,
+    fuzzy_top_k: int = 5,
+):
+    """
+    Codes every row of an uploaded CSV/Excel file of free-text diagnoses and streams
+    the results back as NDJSON (default) or CSV while the file is still being processed.
+    """
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    get_search_index()  # 503 before the upload is spooled
+
+    # FastAPI closes the upload as soon as this function returns, before the
+    # response has streamed, so the rows are read from a private spool on disk.
+    spool = tempfile.TemporaryFile()
+    shutil.copyfileobj(file.file, spool)
+    spool.seek(0)
+
+    def spooled_rows():
+        try:
+            yield from iter_table_rows(spool, file.filename)
+        finally:
+            spool.close()
+
+    rows = spooled_rows()
+    try:
+        first = next(rows, None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if first is None:
+        raise HTTPException(status_code=400, detail="Uploaded file has no rows")
+
+    if column is None:
+        column = next((c for c in DIAGNOSIS_COLUMNS if c in first), next(iter(first)))
+    elif column not in first:
+        rows.close()
+        raise HTTPException(status_code=400, detail=f"Column '{column}' not found in uploaded file")
+
+    coded = _code_rows(chain([first], rows), column, fuzzy_top_k, fuzzy_threshold)
+
+    if format == "csv":
+        def stream_csv():
+            buf = io.StringIO()
+            writer = csv.DictWriter(buf, fieldnames=BULK_CSV_FIELDS)
+            writer.writeheader()
+            for row, text, out in coded:
+                writer.writerow(_flatten_result(row, text, out))
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        return StreamingResponse(stream_csv(), media_type="text/csv",
+                                 headers={"Content-Disposition": "attachment; filename=coded.csv"})
+
+    def stream_ndjson():
+        for row, text, out in coded:
+            yield dumps({"row": row, "disease_text": text, "result": out}) + b"\n"
+    return StreamingResponse(stream_ndjson(), media_type="application/x-ndjson")
 
 @app.post("/save_lookup")
 def save_lookup(req: SaveLookupRequest, db: Session = Depends(get_db)):
@@ -156,82 +748,196 @@ def get_profile(user_id: int, db: Session = Depends(get_db)):
         "lookups": lookups,
     }
 
-def encrypt(value: str) -> str:
-    """A simple placeholder for an encryption function."""
-    return "<encrypted>"
+def get_response_shape(
+    _summary: Optional[str] = None,
+    _elements: Optional[str] = None,
+    prefer: Optional[str] = Header(None),
+) -> ResponseShape:
+    """`_summary`, `_elements` and `Prefer: return=minimal` for transaction-responses."""
+    try:
+        return ResponseShape(_summary, _elements, prefer)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _shape_headers(shape: ResponseShape) -> Dict[str, str]:
+    return {"Preference-Applied": "return=minimal"} if shape.minimal else {}
 
 @app.post("/fhir_resource")
-def process_fhir_bundle(bundle: Bundle):
+def process_fhir_bundle(
+    bundle: Dict[str, Any] = Body(...),
+    db: Session = Depends(get_db),
+    shape: ResponseShape = Depends(get_response_shape),
+):
     """
-    Processes a FHIR Bundle transaction containing Patient and Observation resources.
-    Validates the resources, encrypts sensitive Patient data, and returns a
-    transaction response bundle.
+    Processes a FHIR Bundle transaction containing Patient, Observation and Condition
+    resources. Validates the resources, encrypts the fields named by the encryption
+    policy, codes text-only Conditions with NAMC/NUMC codes, and returns a transaction
+    response bundle.
+
+    Each entry is parsed by its fhir.resources model exactly once, with the
+    business rules applied in the same pass (see fhir_validation.py).
+
+    `_summary=true|text|data|count`, `_elements=a,b` and `Prefer: return=minimal`
+    shrink the echoed resources; they are pruned while the response is serialized.
     """
-    if bundle.resource_type != "Bundle" or bundle.type != "transaction":
-        raise HTTPException(status_code=400, detail="Only transaction bundles are supported")
+    try:
+        entries = check_transaction_bundle(bundle)
+    except BundleError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    autocode_conditions(entries)
+    try:
+        # Large bundles are spread across worker processes; order is preserved
+        response_entries = entry_pool.map(process_entries, entries)
+    except InvalidResource as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    # One bulk write and one commit for the whole transaction bundle
+    store_fhir_resources(db, storage_rows(response_entries, {}))
+    db.commit()
 
-    if not bundle.entry:
-        raise HTTPException(status_code=400, detail="Bundle must contain at least one entry")
+    return Response(
+        render_transaction_response(response_entries, shape),
+        media_type="application/json",
+        headers=_shape_headers(shape),
+    )
 
-    response_entries = []
-    for entry in bundle.entry:
-        resource = entry.resource
-        response_entry = BundleEntry(
-            fullUrl=entry.fullUrl,
-            response=BundleEntryResponse(status="201 Created")
-        )
+def _stream_error_entry(status: str, code: str, message: str) -> Dict:
+    return {"response": {"status": status, "outcome": {
+        "resourceType": "OperationOutcome",
+        "issue": [{"severity": "error", "code": code, "diagnostics": message}],
+    }}}
+
+def _process_entries_streaming(entries: List[Dict], db: Session, ref_map: Dict[str, str]) -> List[Dict]:
+    """Processes and stores one streamed batch; each batch is committed on its own."""
+    autocode_conditions(entries)
+    out = []
+    for entry in entries:
+        if not isinstance(entry.get("resource"), dict):
+            out.append(_stream_error_entry("400 Bad Request", "structure", "Bundle entry must contain a resource"))
+            continue
+        try:
+            out.append(process_bundle_entry(entry))
+        except InvalidResource as e:
+            out.append(_stream_error_entry("422 Unprocessable Entity", "invalid", str(e)))
+    store_fhir_resources(db, storage_rows(out, ref_map))
+    db.commit()
+    return out
 
-        if resource.resource_type == "Patient":
-            try:
-                patient = Patient(**resource.dict())
-                # Basic validation from docs
-                if not patient.name or not patient.name[0].family or not patient.name[0].given:
-                    raise ValueError("Patient name with family and given is required.")
-                if not patient.gender or not patient.birthDate:
-                    raise ValueError("Patient gender and birthDate are required.")
-
-                # "Encrypt" sensitive fields as per documentation
-                if patient.name and patient.name[0]:
-                    patient.name[0].family = encrypt(patient.name[0].family)
-                    patient.name[0].given = [encrypt(name) for name in patient.name[0].given]
-                if patient.address and patient.address[0] and patient.address[0].line:
-                    patient.address[0].line[0] = encrypt(patient.address[0].line[0])
-
-                response_entry.resource = patient
-                response_entry.response.location = f"Patient/{entry.fullUrl.split(':')[-1]}"
-            except Exception as e:
-                raise HTTPException(status_code=422, detail=f"Invalid Patient resource: {e}")
-
-        elif resource.resource_type == "Observation":
-            try:
-                # Basic validation from docs
-                obs = Observation(**resource.dict())
-                if not all([obs.status, obs.code, obs.subject, obs.effectiveDateTime, obs.valueQuantity]):
-                     raise ValueError("Observation is missing required fields.")
+class RequestStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose body generator is still reading the request body.
 
-                # No encryption for Observation
-                response_entry.resource = obs
-                response_entry.response.location = f"Observation/{entry.fullUrl.split(':')[-1]}"
-            except Exception as e:
-                raise HTTPException(status_code=422, detail=f"Invalid Observation resource: {e}")
+    Under ASGI < 2.4 (uvicorn), Starlette runs a disconnect listener next to the body
+    generator, and that listener consumes the http.request messages meant for
+    request.stream(): a body sent in more than one message would hang. Here the
+    generator is the only reader of `receive`; a client that goes away mid-upload
+    surfaces as ClientDisconnect from request.stream().
+    """
 
-        else:
-            # Handle other resource types if necessary, or reject them
-            outcome = OperationOutcome(issue=[OperationOutcomeIssue(
-                severity="error",
-                code="not-supported",
-                diagnostics=f"Resource type '{resource.resource_type}' not supported."
-            )])
-            response_entry.response.status = "400 Bad Request"
-            response_entry.response.outcome = outcome
-
-        response_entries.append(response_entry)
-
-    response_bundle = Bundle.construct(
-        resourceType="Bundle",
-        type="transaction-response",
-        entry=response_entries
-    )
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
 
-    # Return as a dictionary to be automatically converted to JSON by FastAPI
-    return json.loads(response_bundle.json(exclude_none=True))
+@app.post("/fhir_resource/stream")
+async def process_fhir_bundle_stream(request: Request, shape: ResponseShape = Depends(get_response_shape)):
+    """
+    Streaming variant of /fhir_resource for very large transaction bundles.
+
+    The `entry` array is parsed incrementally from the request body and each
+    entry is validated, encrypted and written to the transaction-response as
+    soon as it is complete, so only O(1) entries are held in memory. Because the
+    response has already started, an invalid entry is reported in its own
+    response entry (422 with an OperationOutcome) instead of failing the request.
+    resourceType and type must come before entry in the Bundle.
+    `_summary`, `_elements` and `Prefer: return=minimal` apply as for /fhir_resource,
+    except `_summary=count`, which would hide the per-entry errors.
+
+    Entries are committed batch by batch as they are processed, so the bundle is
+    not atomic: a structural error later in the body (reported as a final 400
+    entry) leaves the entries before it stored. Use /fhir_resource when the
+    transaction must be all-or-nothing.
+    """
+    if shape.count_only:
+        raise HTTPException(status_code=400, detail="_summary=count is not supported for streamed bundles")
+    batches = iter_bundle_entries(request.stream())
+    try:
+        first = await batches.__anext__()
+    except StopAsyncIteration:
+        raise HTTPException(status_code=400, detail="Bundle must contain at least one entry")
+    except BundleError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def body():
+        db = SessionLocal()
+        ref_map: Dict[str, str] = {}
+        try:
+            yield b'{"resourceType":"Bundle","type":"transaction-response","entry":['
+            separator = b""
+            batch = first
+            while batch is not None:
+                for response_entry in await run_in_threadpool(_process_entries_streaming, batch, db, ref_map):
+                    yield separator + dumps(shape.entry_view(response_entry))
+                    separator = b","
+                try:
+                    batch = await batches.__anext__()
+                except StopAsyncIteration:
+                    batch = None
+                except ClientDisconnect:
+                    return
+                except BundleError as e:
+                    yield separator + dumps(_stream_error_entry("400 Bad Request", "structure", str(e)))
+                    batch = None
+            yield b"]}"
+        finally:
+            db.close()
+
+    return RequestStreamingResponse(body(), media_type="application/json", headers=_shape_headers(shape))
+
+# Rows fetched per round trip while exporting
+EXPORT_BATCH_SIZE = 1000
+
+def _stored_types(db: Session) -> List[str]:
+    """Resource types present in the store: the validated types in their usual order, then any others."""
+    stored = set(db.execute(select(FHIRResource.resource_type).distinct()).scalars())
+    known = [t for t in VALIDATORS if t in stored]
+    return known + sorted(stored.difference(known))
+
+@app.get("/$export")
+def bulk_export(_type: Optional[str] = None, _since: Optional[str] = None):
+    """
+    Bulk Data style export of stored FHIR resources as NDJSON, grouped by
+    resource type. Rows are streamed from the database in batches, so the export
+    never holds more than EXPORT_BATCH_SIZE resources in memory.
+    Without `_type`, every stored resource type is exported.
+    """
+    types = [t.strip() for t in _type.split(",") if t.strip()] if _type else None
+    since = None
+    if _since:
+        try:
+            since = datetime.fromisoformat(_since.replace("Z", "+00:00"))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="_since must be an ISO 8601 instant")
+
+    def stream():
+        db = SessionLocal()
+        try:
+            for resource_type in types if types is not None else _stored_types(db):
+                query = (
+                    select(FHIRResource.resource_json)
+                    .where(FHIRResource.resource_type == resource_type)
+                    .order_by(FHIRResource.id)
+                    .execution_options(yield_per=EXPORT_BATCH_SIZE)
+                )
+                if since is not None:
+                    query = query.where(FHIRResource.created_at >= since)
+                for batch in db.execute(query).scalars().partitions():
+                    yield b"".join(dumps(resource) + b"\n" for resource in batch)
+        finally:
+            db.close()
+
+    return StreamingResponse(stream(), media_type="application/fhir+ndjson")
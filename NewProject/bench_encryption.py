@@ -0,0 +1,69 @@
+"""
+Patient field encryption: throughput and output size per mode.
+
+- fernet: the original encrypt_string (Fernet token, base64-encoded a second time)
+- envelope/bundle: AES-GCM, one wrapped data key shared by the whole bundle
+- envelope/resource: AES-GCM, a new wrapped data key per Patient
+
+Usage: python bench_encryption.py [patients]
+"""
+import base64
+import copy
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import orjson
+
+os.environ.setdefault("ENCRYPTION_MODE", "fernet")  # keep simple_app from creating ./kek.key on import
+os.environ.setdefault("BLIND_INDEX_KEY", base64.urlsafe_b64encode(os.urandom(32)).decode())  # nor ./blind_index.key
+
+from envelope import KeyEncryptionKey, encrypt_resource, new_data_key
+from simple_app import encrypt_resource_data, encrypt_string, encryption_policy
+
+PATIENT = {
+    "resourceType": "Patient",
+    "id": "bench",
+    "name": [{"family": "Smith", "given": ["John", "Robert"]}],
+    "gender": "male",
+    "birthDate": "1970-01-01",
+    "address": [{"line": ["123 Main St", "Apt 4B"], "city": "Boston", "state": "MA",
+                 "postalCode": "02115", "country": "USA"}],
+    "telecom": [{"system": "phone", "value": "555-0123"}],
+}
+
+
+def run_fernet(patients, kek):
+    for p in patients:
+        encrypt_resource_data(p, encrypt_string)
+
+
+def run_envelope_bundle(patients, kek):
+    data_key = new_data_key(kek)
+    for p in patients:
+        encrypt_resource(encryption_policy, p, kek, data_key)
+
+
+def run_envelope_resource(patients, kek):
+    for p in patients:
+        encrypt_resource(encryption_policy, p, kek)
+
+
+def main(n: int):
+    kek = KeyEncryptionKey.load_or_create(Path(tempfile.mkdtemp()) / "kek.key")
+    plain = len(orjson.dumps(PATIENT))
+    print(f"{'mode':>18} {'patients/s':>11} {'bytes/patient':>14} {'vs plaintext':>13}")
+    for name, fn in (("fernet", run_fernet), ("envelope/bundle", run_envelope_bundle),
+                     ("envelope/resource", run_envelope_resource)):
+        patients = [copy.deepcopy(PATIENT) for _ in range(n)]
+        started = time.perf_counter()
+        fn(patients, kek)
+        rate = n / (time.perf_counter() - started)
+        size = sum(len(orjson.dumps(p)) for p in patients) / n
+        print(f"{name:>18} {rate:>11.0f} {size:>14.0f} {size / plain:>12.2f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
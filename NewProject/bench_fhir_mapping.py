@@ -0,0 +1,69 @@
+"""
+Rows per second for mapping a patient extract to FHIR.
+
+Compares the per-row map_to_fhir_patient (one validated fhir.resources model per
+row, serialized with model_dump_json) with iter_fhir_bundles, the chunked batch
+mapper, on one process and on all cores.
+
+Usage: python bench_fhir_mapping.py [rows]
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+
+from fhir_mapping import iter_fhir_bundles, map_to_fhir_patient
+
+
+def make_extract(n: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        "patient_id": [str(i) for i in range(n)],
+        "first_name": ["John"] * n,
+        "last_name": ["Smith"] * n,
+        "gender": ["male", "female"] * (n // 2) + ["male"] * (n % 2),
+        "birth_date": ["1970-01-01"] * n,
+        "address": ["123 Main St"] * n,
+        "city": ["Boston"] * n,
+        "state": ["MA"] * n,
+        "postal_code": ["02115"] * n,
+        "country": ["USA"] * n,
+        "phone": ["555-0123"] * n,
+        "email": ["john@example.org"] * n,
+    })
+
+
+def per_row(df: pd.DataFrame) -> int:
+    size = 0
+    for row in df.to_dict("records"):
+        size += len(map_to_fhir_patient(row).model_dump_json(exclude_none=True))
+    return size
+
+
+def batch(df: pd.DataFrame, workers: int) -> int:
+    return sum(len(bundle) for bundle, _ in iter_fhir_bundles("patient", df, workers=workers))
+
+
+def rate(fn, *args) -> float:
+    started = time.perf_counter()
+    fn(*args)
+    return len(args[0]) / (time.perf_counter() - started)
+
+
+def main(n: int):
+    df = make_extract(n)
+    # Model and validator construction is paid once, outside the measurements
+    per_row(df.head(2))
+    batch(df.head(2), 1)
+
+    cores = os.cpu_count() or 1
+    legacy = rate(per_row, df.head(min(n, 20000)))
+    print(f"{'mapper':>22} {'rows/s':>10} {'speedup':>8}")
+    print(f"{'per-row models':>22} {legacy:>10.0f} {1:>7.2f}x")
+    for workers in sorted({1, cores}):
+        r = rate(batch, df, workers)
+        print(f"{f'batch, {workers} process(es)':>22} {r:>10.0f} {r / legacy:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,99 @@
+"""
+Per-entry validation cost of /fhir_resource for 1, 100 and 10,000-entry bundles.
+
+Compares the previous pipeline (whole Bundle parsed by fhir.resources, then each
+entry rebuilt with Patient(**resource.dict()) / Observation(**resource.dict())
+and checked) with the single-pass pipeline in fhir_validation.py.
+
+Usage: python bench_fhir_validation.py [sizes...]
+"""
+import copy
+import sys
+import time
+import uuid
+
+from fhir.resources.bundle import Bundle
+from fhir.resources.observation import Observation
+from fhir.resources.patient import Patient
+
+from fhir_validation import check_transaction_bundle, validate_resource
+
+PATIENT = {
+    "resourceType": "Patient",
+    "name": [{"family": "Smith", "given": ["John", "Robert"]}],
+    "gender": "male",
+    "birthDate": "1970-01-01",
+    "address": [{"line": ["123 Main St", "Apt 4B"], "city": "Boston", "state": "MA",
+                 "postalCode": "02115", "country": "USA"}],
+    "telecom": [{"system": "phone", "value": "555-0123"}],
+}
+
+OBSERVATION = {
+    "resourceType": "Observation",
+    "status": "final",
+    "code": {"coding": [{"system": "http://loinc.org", "code": "8480-6", "display": "Systolic blood pressure"}]},
+    "effectiveDateTime": "2025-09-20T15:30:00Z",
+    "valueQuantity": {"value": 120, "unit": "mmHg", "code": "mm[Hg]"},
+}
+
+
+def make_bundle(n: int) -> dict:
+    """n entries, alternating Patient and an Observation referencing it."""
+    entries = []
+    for i in range(n):
+        ref = f"urn:uuid:{uuid.uuid4()}"
+        if i % 2 == 0:
+            entries.append({"fullUrl": ref, "resource": copy.deepcopy(PATIENT),
+                            "request": {"method": "POST", "url": "Patient"}})
+            patient_ref = ref
+        else:
+            obs = copy.deepcopy(OBSERVATION)
+            obs["subject"] = {"reference": patient_ref}
+            entries.append({"fullUrl": ref, "resource": obs, "request": {"method": "POST", "url": "Observation"}})
+    return {"resourceType": "Bundle", "type": "transaction", "entry": entries}
+
+
+def legacy_pipeline(raw: dict):
+    bundle = Bundle.model_validate(raw)
+    for entry in bundle.entry:
+        resource = entry.resource
+        if resource.get_resource_type() == "Patient":
+            patient = Patient(**resource.dict())
+            if not patient.name or not patient.name[0].family or not patient.name[0].given:
+                raise ValueError("Patient name with family and given is required.")
+            if not patient.gender or not patient.birthDate:
+                raise ValueError("Patient gender and birthDate are required.")
+        else:
+            obs = Observation(**resource.dict())
+            if not all([obs.status, obs.code, obs.subject, obs.effectiveDateTime, obs.valueQuantity]):
+                raise ValueError("Observation is missing required fields.")
+
+
+def single_pass_pipeline(raw: dict):
+    for entry in check_transaction_bundle(raw):
+        validate_resource(entry["resource"])
+
+
+def bench(fn, raw: dict, n: int) -> float:
+    repeat = max(1, 200 // n)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(raw)
+    return (time.perf_counter() - started) / (repeat * n) * 1e6
+
+
+def main(sizes):
+    # Warm up model/validator construction so it doesn't land in the first measurement
+    single_pass_pipeline(make_bundle(2))
+    legacy_pipeline(make_bundle(2))
+
+    print(f"{'entries':>8} {'legacy us/entry':>16} {'single-pass us/entry':>21} {'speedup':>8}")
+    for n in sizes:
+        raw = make_bundle(n)
+        legacy = bench(legacy_pipeline, raw, n)
+        single = bench(single_pass_pipeline, raw, n)
+        print(f"{n:>8} {legacy:>16.1f} {single:>21.1f} {legacy / single:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [1, 100, 10000])
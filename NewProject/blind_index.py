@@ -0,0 +1,132 @@
+"""
+Blind index for equality search on encrypted fields.
+
+Encrypted fields use a random nonce per value, so the ciphertext cannot be
+searched. Next to each encrypted field we store a keyed HMAC-SHA256 digest of
+its normalized plaintext (truncated to 128 bits): equal values give equal
+digests, so a search is an indexed lookup of the query's digest and nothing is
+decrypted. The HMAC key is separate from the encryption keys; without it the
+digests cannot be recomputed from guessed values.
+
+Digests are domain-separated by resource type and field path, so the same
+value under two fields does not produce the same digest. Tokenized fields
+(free text such as address lines) are indexed per word, and a query matches
+when every one of its words does.
+"""
+import hashlib
+import hmac
+import os
+import re
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from envelope import load_or_create_key
+
+BLIND_INDEX_KEY_PATH = Path(os.getenv("BLIND_INDEX_KEY_PATH", "blind_index.key"))
+
+# resourceType -> encrypted field path -> normalization ("text", "telecom" or "tokens")
+BLIND_INDEX_FIELDS: Dict[str, Dict[str, str]] = {
+    "Patient": {
+        "name.family": "text",
+        "name.given": "text",
+        "telecom.value": "telecom",
+        "address.line[0]": "tokens",
+    },
+}
+
+# resourceType -> search parameter -> the indexed fields it matches (any of them)
+SEARCH_PARAMS: Dict[str, Dict[str, List[str]]] = {
+    "Patient": {
+        "family": ["name.family"],
+        "given": ["name.given"],
+        "name": ["name.family", "name.given"],
+        "phone": ["telecom.value"],
+        "telecom": ["telecom.value"],
+        "address": ["address.line[0]"],
+    },
+}
+
+_DIGEST_CHARS = 32
+_WORD = re.compile(r"\w+")
+_FLOAT_NUMBER = re.compile(r"\+?\d+\.0+")
+
+
+def normalize_text(value: str) -> str:
+    """Case-, accent- and whitespace-insensitive form of a value."""
+    decomposed = unicodedata.normalize("NFKD", value)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def normalize_telecom(value: str) -> str:
+    """
+    Emails are compared case-insensitively; phone numbers by their digits only.
+    A number that went through a float ("5550123.0", e.g. from a spreadsheet)
+    loses the ".0" first, so it does not index an extra trailing zero.
+    """
+    value = value.strip()
+    if "@" in value:
+        return value.casefold()
+    if _FLOAT_NUMBER.fullmatch(value):
+        value = value.split(".", 1)[0]
+    return "".join(c for c in value if c.isdigit())
+
+
+def _terms(kind: str, value: str) -> List[str]:
+    if kind == "telecom":
+        normalized = normalize_telecom(value)
+        return [normalized] if normalized else []
+    normalized = normalize_text(value)
+    if kind == "tokens":
+        return list(dict.fromkeys(_WORD.findall(normalized)))
+    return [normalized] if normalized else []
+
+
+class BlindIndex:
+    """Computes digests for stored fields and for search parameters."""
+
+    def __init__(self, key: bytes, fields: Dict[str, Dict[str, str]] = BLIND_INDEX_FIELDS):
+        if len(key) < 32:
+            raise ValueError("The blind index key must be at least 32 bytes")
+        self._key = key
+        self.fields = fields
+
+    @classmethod
+    def load_or_create(cls, path: Path = BLIND_INDEX_KEY_PATH) -> "BlindIndex":
+        """The key from BLIND_INDEX_KEY (base64url), else from `path`, created on first use."""
+        return cls(load_or_create_key("BLIND_INDEX_KEY", path))
+
+    def digest(self, resource_type: str, field: str, term: str) -> str:
+        message = f"{resource_type}.{field}\x00{term}".encode("utf-8")
+        return hmac.new(self._key, message, hashlib.sha256).hexdigest()[:_DIGEST_CHARS]
+
+    def covers(self, resource_type: Optional[str]) -> bool:
+        return resource_type in self.fields
+
+    def rows(self, resource_type: str, resource_id: str, observed: List[Tuple[str, str]]) -> List[Dict]:
+        """
+        Rows for db.store_blind_index from the (path, plaintext) pairs seen while the
+        resource was encrypted; fields without a blind index are skipped.
+        """
+        kinds = self.fields.get(resource_type, {})
+        digests: Set[Tuple[str, str]] = set()
+        for field, value in observed:
+            kind = kinds.get(field)
+            if kind is not None:
+                digests.update((field, self.digest(resource_type, field, t)) for t in _terms(kind, value))
+        return [
+            {"resource_type": resource_type, "resource_id": resource_id, "field": field, "digest": digest}
+            for field, digest in sorted(digests)
+        ]
+
+    def query(self, resource_type: str, param: str, value: str) -> Dict[str, List[str]]:
+        """
+        Field -> digests for one search parameter. A resource matches when, for any
+        field, it has all of that field's digests. Raises KeyError for an unknown parameter.
+        """
+        kinds = self.fields.get(resource_type, {})
+        return {
+            field: [self.digest(resource_type, field, t) for t in _terms(kinds[field], value)]
+            for field in SEARCH_PARAMS[resource_type][param]
+        }
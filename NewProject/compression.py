@@ -0,0 +1,185 @@
+"""
+Negotiated response compression (zstd, brotli, gzip) for selected routes.
+
+brotli and zstandard are optional; when either package is missing that encoding
+is simply not offered and clients fall back to gzip.
+"""
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+class _GzipEncoder:
+    def __init__(self, level: int = 6):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self, quality: int = 4):
+        self._obj = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.process(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush()
+
+    def finish(self) -> bytes:
+        return self._obj.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self, level: int = 3):
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+# Server preference order; the first one the client accepts wins
+ENCODERS = {"gzip": _GzipEncoder}
+if brotli is not None:
+    ENCODERS = {"br": _BrotliEncoder, **ENCODERS}
+if zstandard is not None:
+    ENCODERS = {"zstd": _ZstdEncoder, **ENCODERS}
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the preferred available encoding the client accepts (q > 0)."""
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    for encoding in ENCODERS:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > 0:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware compressing responses of the given path prefixes once
+    they reach `minimum_size` bytes. Streamed bodies are compressed chunk by chunk.
+    """
+
+    def __init__(self, app, paths: Iterable[str], minimum_size: int = 1024):
+        self.app = app
+        self.paths = tuple(paths)
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict((k.lower(), v) for k, v in scope.get("headers", []))
+        encoding = negotiate_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self._start: Optional[dict] = None
+        self._encoder = None
+        self._passthrough = False
+
+    def _headers(self, drop: Tuple[bytes, ...]) -> List[Tuple[bytes, bytes]]:
+        return [(k, v) for k, v in self._start["headers"] if k.lower() not in drop]
+
+    def _vary(self) -> bytes:
+        """The response's Vary values merged into one header, with Accept-Encoding added."""
+        values: List[bytes] = []
+        for k, v in self._start["headers"]:
+            if k.lower() == b"vary":
+                values.extend(part.strip() for part in v.split(b",") if part.strip())
+        if not any(value.lower() in (b"accept-encoding", b"*") for value in values):
+            values.append(b"Accept-Encoding")
+        return b", ".join(values)
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self._start = message
+            self._passthrough = any(k.lower() == b"content-encoding" for k, _ in message.get("headers", []))
+            return
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._passthrough:
+            if self._start is not None:
+                await self._send(self._start)
+                self._start = None
+            await self._send(message)
+            return
+
+        if self._encoder is None:
+            if not more_body and len(body) < self.minimum_size:
+                # Small complete response: send untouched
+                self._passthrough = True
+                await self._send(self._start)
+                self._start = None
+                await self._send(message)
+                return
+
+            self._encoder = ENCODERS[self.encoding]()
+            headers = self._headers((b"content-length", b"content-encoding", b"vary"))
+            headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+            headers.append((b"vary", self._vary()))
+            if not more_body:
+                compressed = self._encoder.compress(body) + self._encoder.finish()
+                headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+                await self._send({**self._start, "headers": headers})
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+            await self._send({**self._start, "headers": headers})
+            self._start = None
+
+        if more_body:
+            chunk = self._encoder.compress(body) + self._encoder.flush()
+        else:
+            chunk = self._encoder.compress(body) + self._encoder.finish()
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
@@ -1,11 +1,19 @@
 import os
+import time
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy import (
+    event, create_engine, delete, insert, select, tuple_, Column, Integer, String, DateTime, ForeignKey, Index,
+    UniqueConstraint
+)
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
 from sqlalchemy.sql import func
 from sqlalchemy.types import JSON
 
+from metrics import DB_COMMIT_LATENCY
+
 DB_URL = os.getenv("DB_URL", "sqlite:///ayush_lookup.db")
 
 def _make_engine(url: str):
@@ -18,6 +26,16 @@ engine = _make_engine(DB_URL)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 Base = declarative_base()
 
+@event.listens_for(SessionLocal, "before_commit")
+def _commit_started(session):
+    session.info["commit_started"] = time.perf_counter()
+
+@event.listens_for(SessionLocal, "after_commit")
+def _commit_finished(session):
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        DB_COMMIT_LATENCY.observe(time.perf_counter() - started)
+
 class User(Base):
     __tablename__ = "users"
 
@@ -39,6 +57,80 @@ class LookupLog(Base):
 
     user = relationship("User", back_populates="lookups")
 
+class FHIRResource(Base):
+    """
+    Resources accepted through the FHIR endpoints (Patient, Observation, Condition), stored
+    as sent back: with their sensitive fields encrypted and Conditions coded.
+    """
+    __tablename__ = "fhir_resources"
+
+    id = Column(Integer, primary_key=True)
+    resource_type = Column(String, nullable=False, index=True)
+    resource_id = Column(String, nullable=False)
+    subject = Column(String, nullable=True, index=True)  # e.g. "Patient/123" for Observations
+    resource_json = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (UniqueConstraint("resource_type", "resource_id", name="uq_fhir_resource_type_id"),)
+
+def _resource_keys_in(key_column, keys: List[Tuple[str, str]]):
+    for i in range(0, len(keys), 500):  # stay under SQLite's bound-parameter limit
+        yield key_column.in_(keys[i:i + 500])
+
+def store_fhir_resources(db, rows: List[Dict]):
+    """
+    Bulk-writes resource rows (resource_type, resource_id, subject, resource_json) in
+    the session's current transaction. Resources that already exist are replaced.
+    """
+    if not rows:
+        return
+    # Last write wins for a resource repeated within the batch
+    rows = list({(r["resource_type"], r["resource_id"]): r for r in rows}.values())
+    keys = [(r["resource_type"], r["resource_id"]) for r in rows]
+    key_column = tuple_(FHIRResource.resource_type, FHIRResource.resource_id)
+    for condition in _resource_keys_in(key_column, keys):
+        db.execute(delete(FHIRResource).where(condition))
+    db.execute(insert(FHIRResource), rows)
+
+class BlindIndexEntry(Base):
+    """
+    Keyed HMAC digests of the plaintext of encrypted fields (see blind_index.py), so
+    equality searches on encrypted data are index lookups instead of bulk decryption.
+    """
+    __tablename__ = "blind_index"
+
+    id = Column(Integer, primary_key=True)
+    resource_type = Column(String, nullable=False)
+    resource_id = Column(String, nullable=False)
+    field = Column(String, nullable=False)  # policy path, e.g. "name.family"
+    digest = Column(String(32), nullable=False)
+
+    __table_args__ = (
+        Index("ix_blind_index_lookup", "resource_type", "field", "digest"),
+        Index("ix_blind_index_resource", "resource_type", "resource_id"),
+    )
+
+def store_blind_index(db, resource_keys: Iterable[Tuple[str, str]], rows: List[Dict]):
+    """
+    Replaces the blind index of the given (resource_type, resource_id) resources with
+    `rows` (resource_type, resource_id, field, digest), in the current transaction.
+    """
+    keys = list(dict.fromkeys(resource_keys))
+    key_column = tuple_(BlindIndexEntry.resource_type, BlindIndexEntry.resource_id)
+    for condition in _resource_keys_in(key_column, keys):
+        db.execute(delete(BlindIndexEntry).where(condition))
+    if rows:
+        db.execute(insert(BlindIndexEntry), rows)
+
+def find_by_blind_index(db, resource_type: str, fields: List[str], digest: str) -> Set[str]:
+    """Ids of resources with `digest` indexed under any of `fields`."""
+    query = select(BlindIndexEntry.resource_id).where(
+        BlindIndexEntry.resource_type == resource_type,
+        BlindIndexEntry.field.in_(fields),
+        BlindIndexEntry.digest == digest,
+    ).distinct()
+    return set(db.execute(query).scalars())
+
 def init_db():
     """Create tables if they don't exist."""
     Base.metadata.create_all(bind=engine)
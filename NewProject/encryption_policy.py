@@ -0,0 +1,145 @@
+"""
+Declarative field-level encryption policy.
+
+The policy lists, per resource type, FHIRPath-like paths of the fields to
+encrypt. Steps are element names separated by dots; a step walks every item
+when the element is a list, and `[n]` selects the n-th item of each list it
+is applied to (so `address.line[0]` is the first line of every address).
+
+Paths are compiled once into a tree of accessors, with shared prefixes merged,
+so applying the policy is a single traversal of each resource that touches
+only the elements named in the policy.
+"""
+import json
+import os
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+ENCRYPTION_POLICY: Dict[str, List[str]] = {
+    "Patient": ["name.family", "name.given", "address.line[0]", "telecom.value"],
+    "Observation": ["valueString", "note.text"],
+    "Condition": ["note.text"],
+}
+
+_STEP = re.compile(r"^([A-Za-z][A-Za-z0-9]*)(?:\[(\d+)\])?$")
+
+Step = Tuple[str, Optional[int]]
+Encryptor = Callable[[str], str]
+# Called with (path, plaintext), for encryptors that bind the field's path
+FieldEncryptor = Callable[[str, str], str]
+# Called with (path, plaintext) for each field just before it is encrypted
+Observer = Optional[Callable[[str, str], None]]
+# Applies one compiled node to a dict; returns the number of fields encrypted
+Accessor = Callable[[Dict[str, Any], FieldEncryptor, Observer], int]
+
+
+def parse_path(path: str) -> List[Step]:
+    steps = []
+    for part in path.split("."):
+        m = _STEP.match(part.strip())
+        if m is None:
+            raise ValueError(f"Invalid encryption path '{path}'")
+        steps.append((m.group(1), int(m.group(2)) if m.group(2) is not None else None))
+    return steps
+
+
+def _build_tree(paths: Iterable[str]) -> Dict[Step, Any]:
+    """Merge paths into a prefix tree; a leaf holds the full path of a field to encrypt."""
+    tree: Dict[Step, Any] = {}
+    for path in paths:
+        node = tree
+        steps = parse_path(path)
+        for i, step in enumerate(steps):
+            last = i == len(steps) - 1
+            if step in node and isinstance(node[step], str) != last:
+                raise ValueError(f"Encryption path '{path}' overlaps another path")
+            if last:
+                node[step] = path
+            else:
+                node = node.setdefault(step, {})
+    return tree
+
+
+def _selected(value: Any, index: Optional[int]) -> List[Any]:
+    if isinstance(value, list):
+        if index is None:
+            return value
+        return [value[index]] if index < len(value) else []
+    return [value] if value is not None and index in (None, 0) else []
+
+
+def _leaf(name: str, index: Optional[int], path: str) -> Accessor:
+    def encrypt_field(obj: Dict[str, Any], encrypt: FieldEncryptor, observe: Observer) -> int:
+        value = obj.get(name)
+        if isinstance(value, str):
+            if index in (None, 0) and value:
+                if observe is not None:
+                    observe(path, value)
+                obj[name] = encrypt(path, value)
+                return 1
+            return 0
+        if isinstance(value, list):
+            positions = range(len(value)) if index is None else [index] if index < len(value) else []
+            count = 0
+            for i in positions:
+                if isinstance(value[i], str) and value[i]:
+                    if observe is not None:
+                        observe(path, value[i])
+                    value[i] = encrypt(path, value[i])
+                    count += 1
+            return count
+        return 0
+    return encrypt_field
+
+
+def _branch(name: str, index: Optional[int], child: Accessor) -> Accessor:
+    def descend(obj: Dict[str, Any], encrypt: FieldEncryptor, observe: Observer) -> int:
+        count = 0
+        for item in _selected(obj.get(name), index):
+            if isinstance(item, dict):
+                count += child(item, encrypt, observe)
+        return count
+    return descend
+
+
+def _compile(tree: Dict[Step, Any]) -> Accessor:
+    accessors = [
+        _leaf(name, index, sub) if isinstance(sub, str) else _branch(name, index, _compile(sub))
+        for (name, index), sub in tree.items()
+    ]
+
+    def apply(obj: Dict[str, Any], encrypt: FieldEncryptor, observe: Observer) -> int:
+        return sum(accessor(obj, encrypt, observe) for accessor in accessors)
+    return apply
+
+
+class EncryptionPolicy:
+    """A policy compiled once; apply() encrypts a resource's fields in place."""
+
+    def __init__(self, policy: Dict[str, List[str]]):
+        self.paths = {resource_type: list(paths) for resource_type, paths in policy.items()}
+        self._accessors = {resource_type: _compile(_build_tree(paths)) for resource_type, paths in policy.items()}
+
+    @classmethod
+    def from_env(cls) -> "EncryptionPolicy":
+        """ENCRYPTION_POLICY_PATH (a JSON object of resourceType -> paths) if set, else the default policy."""
+        path = os.getenv("ENCRYPTION_POLICY_PATH")
+        if not path:
+            return cls(ENCRYPTION_POLICY)
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def covers(self, resource_type: Optional[str]) -> bool:
+        return resource_type in self._accessors
+
+    def apply(self, resource: Dict[str, Any], encrypt: Encryptor, observe: Observer = None) -> int:
+        """
+        Encrypts the policy's fields of `resource` in place; returns how many were
+        encrypted. `observe(path, plaintext)` sees each field first, in the same pass.
+        """
+        return self.apply_by_path(resource, lambda path, value: encrypt(value), observe)
+
+    def apply_by_path(self, resource: Dict[str, Any], encrypt: FieldEncryptor, observe: Observer = None) -> int:
+        """Like apply(), with `encrypt(path, plaintext)` also given each field's policy path."""
+        accessor = self._accessors.get(resource.get("resourceType"))
+        return accessor(resource, encrypt, observe) if accessor is not None else 0
@@ -0,0 +1,197 @@
+"""
+Envelope encryption for sensitive FHIR fields.
+
+A random 256-bit data key encrypts the fields with AES-GCM. The data key is
+stored next to the data only in wrapped form (RFC 3394 AES key wrap under a
+persistent key-encryption key, the KEK), so rotating or revoking the KEK never
+touches the encrypted fields themselves.
+
+Each encrypted field is a single base64url token of nonce || ciphertext || tag:
+12 + len(plaintext) + 16 bytes before encoding, with no second encoding layer.
+Fields are encrypted with associated data naming the resource and the policy
+path (see field_aad), so a ciphertext copied to another field or resource
+fails to decrypt.
+"""
+import base64
+import hashlib
+import os
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.keywrap import aes_key_unwrap, aes_key_wrap
+
+KEK_PATH = Path(os.getenv("KEK_PATH", "kek.key"))
+
+# Extension on Resource.meta carrying the wrapped data key of an encrypted resource
+WRAPPED_KEY_EXTENSION_URL = "http://example.org/fhir/StructureDefinition/wrapped-data-key"
+
+_NONCE_SIZE = 12
+_KEY_TEXT_SIZE = 43  # a 256-bit key in unpadded base64url
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def load_or_create_key(env_var: str, path: Path) -> bytes:
+    """
+    A persistent 256-bit key: from the environment variable (base64url) if set, else
+    from `path`, which is created with a new random key (mode 0600) on first use.
+
+    The new key is written to a temporary file and hard-linked into place, so `path`
+    never exists half-written. When several processes start at once, one link wins
+    and the others read the winner's key. On filesystems without hard links the key
+    file is created exclusively (O_EXCL) and written in place instead; readers then
+    wait for the write to land.
+    """
+    env_key = os.getenv(env_var)
+    if env_key:
+        return _b64decode(env_key.strip())
+    try:
+        return _read_key(path)
+    except FileNotFoundError:
+        pass
+    key = AESGCM.generate_key(bit_length=256)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(_b64encode(key))
+        os.link(tmp, path)
+    except FileExistsError:
+        return _read_key(path)
+    except OSError:
+        return _create_key_file(path, key)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return key
+
+
+def _create_key_file(path: Path, key: bytes) -> bytes:
+    """Fallback for load_or_create_key when `path` cannot be hard-linked."""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return _read_key(path)
+    with os.fdopen(fd, "w") as f:
+        f.write(_b64encode(key))
+    return key
+
+
+def _read_key(path: Path, attempts: int = 50) -> bytes:
+    """The key in `path`, waiting briefly while another process is still writing it."""
+    for _ in range(attempts):
+        text = path.read_text().strip()
+        if len(text) >= _KEY_TEXT_SIZE:
+            return _b64decode(text)
+        time.sleep(0.01)
+    raise ValueError(f"Key file {path} is incomplete")
+
+
+class KeyEncryptionKey:
+    """Wraps and unwraps data keys. `kid` identifies the KEK a wrapped key belongs to."""
+
+    def __init__(self, key: bytes):
+        if len(key) != 32:
+            raise ValueError("The key-encryption key must be 32 bytes")
+        self._key = key
+        self.kid = hashlib.sha256(key).hexdigest()[:8]
+
+    @classmethod
+    def load_or_create(cls, path: Path = KEK_PATH) -> "KeyEncryptionKey":
+        """The KEK from ENVELOPE_KEK (base64url), else from `path`, created on first use."""
+        return cls(load_or_create_key("ENVELOPE_KEK", path))
+
+    def wrap(self, data_key: bytes) -> str:
+        return f"{self.kid}:{_b64encode(aes_key_wrap(self._key, data_key))}"
+
+    def unwrap(self, wrapped: str) -> bytes:
+        kid, _, blob = wrapped.partition(":")
+        if kid != self.kid:
+            raise ValueError(f"Data key was wrapped by key '{kid}', not '{self.kid}'")
+        return aes_key_unwrap(self._key, _b64decode(blob))
+
+
+class DataKey:
+    """One AES-GCM data key and its wrapped form. Picklable, for worker processes."""
+
+    __slots__ = ("key", "wrapped", "_aead")
+
+    def __init__(self, key: bytes, wrapped: str):
+        self.key = key
+        self.wrapped = wrapped
+        self._aead = AESGCM(key)
+
+    def __reduce__(self):
+        return DataKey, (self.key, self.wrapped)
+
+    def encrypt(self, text: Optional[str], aad: Optional[bytes] = None) -> Optional[str]:
+        if not text:
+            return text
+        nonce = os.urandom(_NONCE_SIZE)
+        return _b64encode(nonce + self._aead.encrypt(nonce, text.encode("utf-8"), aad))
+
+    def decrypt(self, token: Optional[str], aad: Optional[bytes] = None) -> Optional[str]:
+        if not token:
+            return token
+        raw = _b64decode(token)
+        return self._aead.decrypt(raw[:_NONCE_SIZE], raw[_NONCE_SIZE:], aad).decode("utf-8")
+
+    def field_decryptor(self, resource: dict) -> Callable[[str, str], str]:
+        """decrypt(path, token) for the policy fields of `resource`, for EncryptionPolicy.apply_by_path."""
+        return lambda path, token: self.decrypt(token, field_aad(resource, path))
+
+
+def field_aad(resource: dict, path: str) -> bytes:
+    """Associated data of an encrypted field: "Type/id#policy.path"."""
+    return f"{resource.get('resourceType')}/{resource.get('id')}#{path}".encode("utf-8")
+
+
+def new_data_key(kek: KeyEncryptionKey) -> DataKey:
+    key = AESGCM.generate_key(bit_length=256)
+    return DataKey(key, kek.wrap(key))
+
+
+def open_data_key(kek: KeyEncryptionKey, wrapped: str) -> DataKey:
+    return DataKey(kek.unwrap(wrapped), wrapped)
+
+
+def encrypt_resource(policy, resource: dict, kek: KeyEncryptionKey,
+                     data_key: Optional[DataKey] = None, observe=None) -> Optional[DataKey]:
+    """
+    Encrypts the fields of `resource` named by `policy` (an EncryptionPolicy) in place,
+    under `data_key` or, when it is None, a new data key created only once a field is
+    actually encrypted. Returns the data key used, recorded in resource.meta, or None
+    when the resource had nothing to encrypt.
+    """
+    def encrypt(path: str, text: str) -> str:
+        nonlocal data_key
+        if data_key is None:
+            data_key = new_data_key(kek)
+        return data_key.encrypt(text, field_aad(resource, path))
+
+    if not policy.apply_by_path(resource, encrypt, observe):
+        return None
+    attach_wrapped_key(resource, data_key)
+    return data_key
+
+
+def attach_wrapped_key(resource: dict, data_key: DataKey):
+    """Records the wrapped data key in resource.meta so the resource can be decrypted later."""
+    meta = resource.setdefault("meta", {})
+    extensions = [e for e in meta.get("extension", []) if e.get("url") != WRAPPED_KEY_EXTENSION_URL]
+    extensions.append({"url": WRAPPED_KEY_EXTENSION_URL, "valueString": data_key.wrapped})
+    meta["extension"] = extensions
+
+
+def wrapped_key_of(resource: dict) -> Optional[str]:
+    for ext in (resource.get("meta") or {}).get("extension", []):
+        if ext.get("url") == WRAPPED_KEY_EXTENSION_URL:
+            return ext.get("valueString")
+    return None
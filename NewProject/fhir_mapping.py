@@ -1,8 +1,19 @@
 import json
+import os
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from fhir.resources.patient import Patient
 from fhir.resources.observation import Observation
 from fhir.resources.condition import Condition
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, Iterator, List, Literal, Tuple, Union
+
+import pandas as pd
+from pydantic import ConfigDict, StringConstraints, TypeAdapter, ValidationError
+from typing_extensions import Annotated, Required, TypedDict
+
+from serialization import dumps
 
 def map_to_fhir_patient(data: Dict[str, Any]) -> Patient:
     return Patient(
@@ -56,3 +67,233 @@ def map_to_fhir_condition(data: Dict[str, Any], patient_id: str) -> Condition:
         },
         onsetDateTime=data.get('onset_date', '')
     )
+
+
+# ---------------------------------------------------------------------------
+# Batch mapping of tabular extracts to transaction bundles
+#
+# The per-row functions above build and validate a fhir.resources model for
+# every row. For large extracts the rows are instead cleaned column-wise with
+# pandas, checked in one call per chunk by a compiled pydantic-core schema, and
+# written straight to bundle JSON. Chunks are mapped on worker processes.
+# ---------------------------------------------------------------------------
+
+BATCH_CHUNK_SIZE = int(os.getenv("FHIR_MAPPING_CHUNK_SIZE", "5000"))
+
+# FHIR primitive formats (https://hl7.org/fhir/datatypes.html)
+FHIR_DATE = r"^([0-9]([0-9]([0-9][1-9]|[1-9]0)|[1-9]00)|[1-9]000)(-(0[1-9]|1[0-2])(-(0[1-9]|[1-2][0-9]|3[0-1]))?)?$"
+FHIR_DATETIME = (
+    r"^([0-9]([0-9]([0-9][1-9]|[1-9]0)|[1-9]00)|[1-9]000)(-(0[1-9]|1[0-2])(-(0[1-9]|[1-2][0-9]|3[0-1])"
+    r"(T([01][0-9]|2[0-3]):[0-5][0-9]:([0-5][0-9]|60)(\.[0-9]{1,9})?(Z|(\+|-)((0[0-9]|1[0-3]):[0-5][0-9]|14:00)))?)?)?$"
+)
+
+_Text = Annotated[str, StringConstraints(strip_whitespace=True, min_length=1)]
+_Date = Annotated[str, StringConstraints(pattern=FHIR_DATE)]
+_DateTime = Annotated[str, StringConstraints(pattern=FHIR_DATETIME)]
+
+
+class PatientRow(TypedDict, total=False):
+    __pydantic_config__ = ConfigDict(coerce_numbers_to_str=True)
+    patient_id: Required[_Text]
+    first_name: Required[_Text]
+    last_name: Required[_Text]
+    gender: Required[Literal["male", "female", "other", "unknown"]]
+    birth_date: Required[_Date]
+    address: _Text
+    city: _Text
+    state: _Text
+    postal_code: _Text
+    country: _Text
+    phone: _Text
+    email: _Text
+
+
+class ObservationRow(TypedDict, total=False):
+    __pydantic_config__ = ConfigDict(coerce_numbers_to_str=True)
+    patient_id: Required[_Text]
+    loinc_code: Required[_Text]
+    observation_name: _Text
+    value: Required[float]
+    unit: _Text
+    unit_code: _Text
+    observation_date: Required[_DateTime]
+
+
+class ConditionRow(TypedDict, total=False):
+    __pydantic_config__ = ConfigDict(coerce_numbers_to_str=True)
+    patient_id: Required[_Text]
+    snomed_code: Required[_Text]
+    condition_name: _Text
+    onset_date: _DateTime
+
+
+def _patient_resource(r: Dict[str, Any]) -> Dict[str, Any]:
+    address = {k: v for k, v in (
+        ("line", [r["address"]] if "address" in r else None),
+        ("city", r.get("city")),
+        ("state", r.get("state")),
+        ("postalCode", r.get("postal_code")),
+        ("country", r.get("country")),
+    ) if v is not None}
+    telecom = [{"system": s, "value": r[k]} for s, k in (("phone", "phone"), ("email", "email")) if k in r]
+    resource = {
+        "resourceType": "Patient",
+        "id": r["patient_id"],
+        "name": [{"family": r["last_name"], "given": [r["first_name"]]}],
+        "gender": r["gender"],
+        "birthDate": r["birth_date"],
+    }
+    if address:
+        resource["address"] = [address]
+    if telecom:
+        resource["telecom"] = telecom
+    return resource
+
+
+def _observation_resource(r: Dict[str, Any]) -> Dict[str, Any]:
+    coding = {"system": "http://loinc.org", "code": r["loinc_code"]}
+    if "observation_name" in r:
+        coding["display"] = r["observation_name"]
+    quantity = {"value": r["value"]}
+    if "unit" in r:
+        quantity["unit"] = r["unit"]
+    if "unit_code" in r:
+        quantity.update(system="http://unitsofmeasure.org", code=r["unit_code"])
+    return {
+        "resourceType": "Observation",
+        "status": "final",
+        "code": {"coding": [coding]},
+        "subject": {"reference": f"Patient/{r['patient_id']}"},
+        "effectiveDateTime": r["observation_date"],
+        "valueQuantity": quantity,
+    }
+
+
+def _condition_resource(r: Dict[str, Any]) -> Dict[str, Any]:
+    coding = {"system": "http://snomed.info/sct", "code": r["snomed_code"]}
+    if "condition_name" in r:
+        coding["display"] = r["condition_name"]
+    resource = {
+        "resourceType": "Condition",
+        "clinicalStatus": {"coding": [{
+            "system": "http://terminology.hl7.org/CodeSystem/condition-clinical", "code": "active"
+        }]},
+        "code": {"coding": [coding]},
+        "subject": {"reference": f"Patient/{r['patient_id']}"},
+    }
+    if "onset_date" in r:
+        resource["onsetDateTime"] = r["onset_date"]
+    return resource
+
+
+# kind -> (row schema, row -> resource, PUT by id?, columns formatted as FHIR date / dateTime)
+_BATCH_KINDS = {
+    "patient": (PatientRow, _patient_resource, True, {"birth_date": "date"}),
+    "observation": (ObservationRow, _observation_resource, False, {"observation_date": "dateTime"}),
+    "condition": (ConditionRow, _condition_resource, False, {"onset_date": "dateTime"}),
+}
+
+# One compiled validator per kind, validating a whole chunk of rows per call
+_ROW_VALIDATORS = {kind: TypeAdapter(List[spec[0]]) for kind, spec in _BATCH_KINDS.items()}
+
+
+def _format_dates(series: pd.Series, kind: str) -> pd.Series:
+    parsed = pd.to_datetime(series, errors="coerce", utc=kind == "dateTime")
+    if kind == "date":
+        formatted = parsed.dt.strftime("%Y-%m-%d")
+    else:
+        formatted = parsed.dt.strftime("%Y-%m-%dT%H:%M:%S+00:00")
+    # Values pandas could not parse are passed through and left to the schema to reject
+    return formatted.where(parsed.notna(), series)
+
+
+def _clean_frame(df: pd.DataFrame, kind: str) -> List[Dict[str, Any]]:
+    """Column-wise cleanup: known columns only, dates formatted, blanks and NaN dropped from each row."""
+    schema, _, _, date_columns = _BATCH_KINDS[kind]
+    columns = [c for c in schema.__annotations__ if c in df.columns]
+    df = df[columns].copy()
+    for column in columns:
+        if column in date_columns and not pd.api.types.is_string_dtype(df[column]):
+            df[column] = _format_dates(df[column], date_columns[column])
+        elif pd.api.types.is_object_dtype(df[column]) or pd.api.types.is_string_dtype(df[column]):
+            df[column] = df[column].astype("string").str.strip().replace("", pd.NA)
+    # Column lists zipped into rows; much cheaper than DataFrame.to_dict("records")
+    values = [df[c].astype(object).where(df[c].notna(), None).tolist() for c in columns]
+    return [{k: v for k, v in zip(columns, row) if v is not None} for row in zip(*values)]
+
+
+def map_rows_to_bundle(kind: str, df: pd.DataFrame, first_row: int = 0) -> Tuple[bytes, List[Dict]]:
+    """
+    Map one chunk to transaction Bundle JSON. Returns the bundle bytes and the rejected
+    rows as {"row": <position in the whole extract>, "errors": [...]}; valid rows are kept.
+    """
+    _, to_resource, put_by_id, _ = _BATCH_KINDS[kind]
+    rows = _clean_frame(df, kind)
+    try:
+        valid = _ROW_VALIDATORS[kind].validate_python(rows)
+        rejected: Dict[int, List[str]] = {}
+    except ValidationError as e:
+        rejected = {}
+        for err in e.errors(include_url=False):
+            rejected.setdefault(err["loc"][0], []).append(f"{'.'.join(map(str, err['loc'][1:]))}: {err['msg']}")
+        valid = _ROW_VALIDATORS[kind].validate_python([r for i, r in enumerate(rows) if i not in rejected])
+
+    entries = []
+    for row in valid:
+        resource = to_resource(row)
+        if put_by_id:
+            request = {"method": "PUT", "url": f"{resource['resourceType']}/{resource['id']}"}
+        else:
+            request = {"method": "POST", "url": resource["resourceType"]}
+        entries.append({"fullUrl": f"urn:uuid:{uuid.uuid4()}", "resource": resource, "request": request})
+    bundle = dumps({"resourceType": "Bundle", "type": "transaction", "entry": entries})
+    errors = [{"row": first_row + i, "errors": msgs} for i, msgs in sorted(rejected.items())]
+    return bundle, errors
+
+
+def _iter_frames(rows: Union[pd.DataFrame, Iterable[Dict[str, Any]]], chunk_size: int) -> Iterator[pd.DataFrame]:
+    if isinstance(rows, pd.DataFrame):
+        for start in range(0, len(rows), chunk_size):
+            yield rows.iloc[start:start + chunk_size]
+        return
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, chunk_size))
+        if not chunk:
+            return
+        yield pd.DataFrame.from_records(chunk)
+
+
+def iter_fhir_bundles(
+    kind: str,
+    rows: Union[pd.DataFrame, Iterable[Dict[str, Any]]],
+    chunk_size: int = BATCH_CHUNK_SIZE,
+    workers: int = 1
+) -> Iterator[Tuple[bytes, List[Dict]]]:
+    """
+    Map a DataFrame or an iterator of row dicts ("patient", "observation" or "condition"
+    columns as in the map_to_fhir_* functions) to transaction bundles of up to
+    `chunk_size` entries, yielded in input order as (bundle JSON, rejected rows).
+    With workers > 1 chunks are mapped on that many processes; only a bounded number
+    of chunks is in flight, so a row iterator is never read far ahead of the consumer.
+    """
+    if kind not in _BATCH_KINDS:
+        raise ValueError(f"kind must be one of {', '.join(_BATCH_KINDS)}")
+    frames = _iter_frames(rows, chunk_size)
+    if workers <= 1:
+        first_row = 0
+        for frame in frames:
+            yield map_rows_to_bundle(kind, frame, first_row)
+            first_row += len(frame)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        first_row = 0
+        for frame in frames:
+            pending.append(executor.submit(map_rows_to_bundle, kind, frame, first_row))
+            first_row += len(frame)
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
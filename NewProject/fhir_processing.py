@@ -0,0 +1,146 @@
+"""
+Per-entry processing of transaction bundles: validate, encrypt, build the
+transaction-response entry. Kept free of the FastAPI app so worker processes
+can import it cheaply.
+"""
+import uuid
+from typing import Any, Dict, List, Optional
+
+from encryption_policy import EncryptionPolicy
+from fhir_validation import UnsupportedResource, validate_resource
+from terminology import CODE_SYSTEMS
+
+# Which fields of which resource types are encrypted (see encryption_policy.py)
+encryption_policy = EncryptionPolicy.from_env()
+
+def encrypt(value: str) -> str:
+    """A simple placeholder for an encryption function."""
+    return "<encrypted>"
+
+def encrypt_resource_fields(resource: Dict) -> Dict:
+    """Encrypts the fields named by the encryption policy for this resource type, in place."""
+    encryption_policy.apply(resource, encrypt)
+    return resource
+
+def assign_resource_id(entry: Dict) -> str:
+    """
+    The server id for a created resource: its own id if it has one, else the
+    uuid of a urn:uuid fullUrl (so intra-bundle references stay predictable),
+    else a fresh uuid. The id is written into the resource.
+    """
+    resource = entry["resource"]
+    resource_id = resource.get("id")
+    if not resource_id:
+        full_url = entry.get("fullUrl") or ""
+        resource_id = full_url.rstrip("/").rsplit(":" if full_url.startswith("urn:") else "/", 1)[-1]
+        resource_id = resource_id or str(uuid.uuid4())
+        resource["id"] = resource_id
+    return resource_id
+
+def entry_location(resource_type: str, entry: Dict) -> str:
+    return f"{resource_type}/{assign_resource_id(entry)}"
+
+class InvalidResource(ValueError):
+    """An entry's resource failed validation; the message is the client-facing detail."""
+
+def process_bundle_entry(entry: Dict) -> Dict:
+    """
+    Validates one transaction entry, encrypts the policy's fields and returns the
+    transaction-response entry. Unsupported resource types produce a 400 entry
+    with an OperationOutcome; invalid resources raise InvalidResource.
+    """
+    resource = entry["resource"]
+    response_entry = {"fullUrl": entry["fullUrl"]} if entry.get("fullUrl") else {}
+
+    try:
+        validate_resource(resource)
+    except UnsupportedResource as e:
+        response_entry["response"] = {
+            "status": "400 Bad Request",
+            "outcome": {
+                "resourceType": "OperationOutcome",
+                "issue": [{"severity": "error", "code": "not-supported", "diagnostics": str(e)}],
+            },
+        }
+        return response_entry
+    except Exception as e:
+        raise InvalidResource(f"Invalid {resource.get('resourceType')} resource: {e}")
+
+    resource_type = resource["resourceType"]
+    # "Encrypt" the sensitive fields the policy names for this type
+    encrypt_resource_fields(resource)
+
+    # The validated input is echoed back as-is rather than re-serializing the model
+    response_entry["resource"] = resource
+    response_entry["response"] = {"status": "201 Created", "location": entry_location(resource_type, entry)}
+    return response_entry
+
+def process_entries(entries: List[Dict]) -> List[Dict]:
+    """Processes a slice of entries in order; used as the unit of work for worker processes."""
+    return [process_bundle_entry(entry) for entry in entries]
+
+def _uncoded_conditions(entries: List[Dict]):
+    for entry in entries:
+        resource = entry.get("resource") if isinstance(entry, dict) else None
+        if not isinstance(resource, dict) or resource.get("resourceType") != "Condition":
+            continue
+        code = resource.get("code")
+        if isinstance(code, dict) and not code.get("coding") and isinstance(code.get("text"), str) and code["text"].strip():
+            yield code
+
+def uncoded_condition_texts(entries: List[Dict]) -> List[str]:
+    """Distinct code.text values of Conditions that carry no coding, in bundle order."""
+    return list(dict.fromkeys(code["text"] for code in _uncoded_conditions(entries)))
+
+def add_condition_codings(entries: List[Dict], results: Dict[str, Dict]):
+    """Codes text-only Conditions in place with the NAMC/NUMC match found for their text, if any."""
+    for code in _uncoded_conditions(entries):
+        result = results.get(code["text"]) or {}
+        if "code" in result:
+            code["coding"] = [{
+                "system": CODE_SYSTEMS[result["discipline"]],
+                "code": result["code"],
+                "display": result["label"],
+            }]
+
+def _subject_reference(resource: Dict) -> Optional[str]:
+    subject = resource.get("subject")
+    return subject.get("reference") if isinstance(subject, dict) else None
+
+def resolve_references(resource: Dict, ref_map: Dict[str, str]):
+    """Rewrites, in place, every Reference.reference of `resource` found in `ref_map`."""
+    stack: List[Any] = [resource]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            ref = node.get("reference")
+            if isinstance(ref, str) and ref in ref_map:
+                node["reference"] = ref_map[ref]
+            stack.extend(v for v in node.values() if isinstance(v, (dict, list)))
+        else:
+            stack.extend(v for v in node if isinstance(v, (dict, list)))
+
+def storage_rows(response_entries: List[Dict], ref_map: Dict[str, str]) -> List[Dict]:
+    """
+    Rows for db.store_fhir_resources from the created entries of a response bundle.
+    `ref_map` (fullUrl -> Type/id) is extended with this batch, and references to a
+    bundle fullUrl are rewritten to the resolved Type/id in the resources themselves,
+    so the stored (and echoed) JSON does not keep urn:uuid references. A streamed
+    bundle only resolves fullUrls of the same or an earlier batch.
+    """
+    created = [e for e in response_entries if "resource" in e]
+    for e in created:
+        if e.get("fullUrl"):
+            ref_map[e["fullUrl"]] = e["response"]["location"]
+    rows = []
+    for e in created:
+        resource = e["resource"]
+        if ref_map:
+            resolve_references(resource, ref_map)
+        rows.append({
+            "resource_type": resource["resourceType"],
+            "resource_id": resource["id"],
+            "subject": _subject_reference(resource),
+            "resource_json": resource,
+        })
+    return rows
@@ -0,0 +1,181 @@
+"""
+Incremental parsing of a transaction Bundle's `entry` array from a byte stream.
+
+Only the bytes of the entry currently being read are buffered, so a bundle of
+any size is processed with O(1) entries in memory. The scanner jumps between
+structural characters with a regex instead of looking at every byte.
+
+Streaming requires `resourceType` and `type` to appear before `entry` in the
+Bundle, which is how FHIR serializers write them; a bundle with `entry` first
+is rejected rather than buffered. Every element of `entry` must be an object.
+"""
+import re
+from typing import AsyncIterator, Dict, List, Optional
+
+import orjson
+
+from fhir_validation import BundleError
+
+_TOP_LEVEL = re.compile(rb'["{}\[\]:,]')
+_NESTED = re.compile(rb'["{}\[\]]')
+_IN_STRING = re.compile(rb'["\\]')
+# Between entries only whitespace and commas may precede the next "{" or the closing "]"
+_BETWEEN_ENTRIES = re.compile(rb'[^\s,]')
+
+
+class BundleStreamParser:
+    """
+    Feed raw body chunks; get back the complete entry dicts found so far.
+    Top-level scalar fields are collected into `fields` as they are seen.
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, object] = {}
+        self._buf = bytearray()
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._string_start = 0
+        self._expect_key = True
+        self._key: Optional[str] = None
+        self._in_entry_array = False
+        self._entry_start: Optional[int] = None
+        self._done = False
+        self._error: Optional[Exception] = None
+        self.entry_count = 0
+
+    def feed(self, chunk: bytes) -> List[Dict]:
+        """
+        Entries completed before a structural error in the same chunk are still
+        returned; the error is then raised by the next feed() or close().
+        """
+        if self._error is not None:
+            raise self._error
+        self._buf.extend(chunk)
+        entries: List[Dict] = []
+        try:
+            self._scan(entries)
+        except (BundleError, orjson.JSONDecodeError) as e:
+            if not entries:
+                raise
+            self._error = e
+            return entries
+        self._compact()
+        return entries
+
+    def close(self):
+        if self._error is not None:
+            raise self._error
+        if not self._done:
+            raise BundleError("Bundle JSON ended unexpectedly")
+        self._check_envelope()
+        if not self.entry_count:
+            raise BundleError("Bundle must contain at least one entry")
+
+    def _compact(self):
+        keep = self._entry_start if self._entry_start is not None else (
+            self._string_start if self._in_string else self._pos
+        )
+        if keep:
+            del self._buf[:keep]
+            self._pos -= keep
+            self._string_start -= keep
+            if self._entry_start is not None:
+                self._entry_start -= keep
+
+    def _check_envelope(self):
+        if self.fields.get("resourceType") != "Bundle" or self.fields.get("type") != "transaction":
+            if "resourceType" not in self.fields or "type" not in self.fields:
+                raise BundleError("Streaming mode needs resourceType and type before entry")
+            raise BundleError("Only transaction bundles are supported")
+
+    def _scan(self, entries: List[Dict]):
+        buf = self._buf
+        while not self._done:
+            if self._in_string:
+                m = _IN_STRING.search(buf, self._pos)
+                if m is None:
+                    self._pos = len(buf)
+                    break
+                if m.group() == b"\\":
+                    if m.end() >= len(buf):
+                        self._pos = m.start()
+                        break
+                    self._pos = m.end() + 1
+                    continue
+                self._pos = m.end()
+                self._in_string = False
+                if self._depth == 1:
+                    self._top_level_string(bytes(buf[self._string_start:self._pos]))
+                continue
+
+            if self._depth == 0:
+                start = buf.find(b"{", self._pos)
+                if start < 0:
+                    self._pos = len(buf)
+                    break
+                self._pos = start + 1
+                self._depth = 1
+                continue
+
+            if self._depth == 2 and self._in_entry_array:
+                m = _BETWEEN_ENTRIES.search(buf, self._pos)
+                if m is not None and m.group() not in (b"{", b"]"):
+                    raise BundleError("Bundle entries must be objects")
+            else:
+                m = (_TOP_LEVEL if self._depth == 1 else _NESTED).search(buf, self._pos)
+            if m is None:
+                self._pos = len(buf)
+                break
+            ch = m.group()
+            self._pos = m.end()
+
+            if ch == b'"':
+                self._in_string = True
+                self._string_start = m.start()
+            elif ch == b":":
+                self._expect_key = False
+            elif ch == b",":
+                self._expect_key = True
+            elif ch in (b"{", b"["):
+                if self._depth == 1 and self._key == "entry" and not self._expect_key:
+                    if ch != b"[":
+                        raise BundleError("Bundle entry must be an array")
+                    self._check_envelope()
+                    self._in_entry_array = True
+                elif self._depth == 2 and self._in_entry_array:
+                    if ch != b"{":
+                        raise BundleError("Bundle entries must be objects")
+                    self._entry_start = m.start()
+                self._depth += 1
+            else:  # closing bracket
+                self._depth -= 1
+                if self._depth == 2 and self._in_entry_array and self._entry_start is not None:
+                    entries.append(orjson.loads(bytes(buf[self._entry_start:self._pos])))
+                    self._entry_start = None
+                    self.entry_count += 1
+                elif self._depth == 1 and self._in_entry_array:
+                    self._in_entry_array = False
+                elif self._depth == 0:
+                    self._done = True
+
+    def _top_level_string(self, raw: bytes):
+        value = orjson.loads(raw)
+        if self._expect_key:
+            self._key = value
+        else:
+            self.fields[self._key] = value
+
+
+async def iter_bundle_entries(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[Dict]]:
+    """Yield batches of entries as soon as each body chunk completes them."""
+    parser = BundleStreamParser()
+    try:
+        async for chunk in chunks:
+            entries = parser.feed(chunk)
+            if entries:
+                yield entries
+        parser.close()
+    except orjson.JSONDecodeError as e:
+        raise BundleError(f"Malformed bundle entry: {e}")
+
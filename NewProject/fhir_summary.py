@@ -0,0 +1,111 @@
+"""
+Response shaping for transaction-responses: `_summary`, `_elements` and
+`Prefer: return=minimal`.
+
+Pruning happens while each response entry is serialized. Only the top-level
+keys that survive are copied into a shallow view of the resource, so a full
+pruned copy of the bundle is never built. The stored resources are untouched.
+"""
+from typing import Dict, FrozenSet, Iterable, Optional
+
+from fhir_validation import VALIDATORS
+from serialization import dumps
+
+# resourceType -> top-level elements flagged isSummary in the FHIR specification
+SUMMARY_ELEMENTS: Dict[str, FrozenSet[str]] = {
+    resource_type: frozenset(model.summary_elements_sequence())
+    for resource_type, (model, _) in VALIDATORS.items()
+}
+
+# Always kept in a subsetted resource
+_MANDATORY = frozenset(("resourceType", "id", "meta"))
+
+SUBSETTED_TAG = {
+    "system": "http://terminology.hl7.org/CodeSystem/v3-ObservationValue",
+    "code": "SUBSETTED",
+}
+
+SUMMARY_MODES = ("true", "false", "count", "text", "data")
+
+
+class ResponseShape:
+    """What to keep of each resource echoed in a transaction-response."""
+
+    def __init__(self, summary: Optional[str] = None, elements: Optional[str] = None, prefer: Optional[str] = None):
+        summary = (summary or "false").strip().lower()
+        if summary not in SUMMARY_MODES:
+            raise ValueError(f"_summary must be one of {', '.join(SUMMARY_MODES)}")
+        if elements is not None and summary != "false":
+            raise ValueError("_summary and _elements cannot be combined")
+        self.summary = summary
+        self.elements: Optional[FrozenSet[str]] = None
+        if elements is not None:
+            self.elements = frozenset(_element_name(e.strip()) for e in elements.split(",") if e.strip())
+        self.minimal = _prefers_minimal(prefer)
+
+    @property
+    def count_only(self) -> bool:
+        return self.summary == "count"
+
+    @property
+    def full(self) -> bool:
+        return self.summary == "false" and self.elements is None and not self.minimal
+
+    def _keep(self, resource: Dict) -> Optional[Iterable[str]]:
+        """The top-level keys to keep, or None when the resource is returned whole."""
+        if self.elements is not None:
+            return _MANDATORY | self.elements
+        if self.summary == "true":
+            return _MANDATORY | SUMMARY_ELEMENTS.get(resource.get("resourceType"), frozenset())
+        if self.summary == "text":
+            return _MANDATORY | {"text"}
+        if self.summary == "data":
+            return resource.keys() - {"text"}
+        return None
+
+    def resource_view(self, resource: Dict) -> Dict:
+        keep = self._keep(resource)
+        if keep is None:
+            return resource
+        view = {k: v for k, v in resource.items() if k in keep}
+        if len(view) < len(resource):
+            meta = dict(view.get("meta") or {})
+            meta["tag"] = [*meta.get("tag", []), SUBSETTED_TAG]
+            view["meta"] = meta
+        return view
+
+    def entry_view(self, entry: Dict) -> Dict:
+        if "resource" not in entry or self.full:
+            return entry
+        if self.minimal:
+            return {k: v for k, v in entry.items() if k != "resource"}
+        return {**entry, "resource": self.resource_view(entry["resource"])}
+
+
+def _element_name(path: str) -> str:
+    """
+    The top-level element named by an `_elements` item: "name" and "Patient.name"
+    are accepted, deeper paths such as "name.given" are rejected.
+    """
+    parts = path.split(".")
+    if len(parts) > 1 and parts[0][:1].isupper():
+        parts = parts[1:]
+    if len(parts) != 1 or not parts[0]:
+        raise ValueError(f"_elements supports top-level elements only, not '{path}'")
+    return parts[0]
+
+def _prefers_minimal(prefer: Optional[str]) -> bool:
+    for part in (prefer or "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name.strip().lower() == "return":
+            return value.strip().strip('"').lower() == "minimal"
+    return False
+
+
+def render_transaction_response(entries: Iterable[Dict], shape: ResponseShape) -> bytes:
+    """Serialize a transaction-response Bundle, pruning each entry as it is written."""
+    entries = list(entries)
+    if shape.count_only:
+        return dumps({"resourceType": "Bundle", "type": "transaction-response", "total": len(entries)})
+    body = b",".join(dumps(shape.entry_view(e)) for e in entries)
+    return b'{"resourceType":"Bundle","type":"transaction-response","entry":[' + body + b"]}"
@@ -0,0 +1,125 @@
+"""
+Single-pass validation of transaction bundle entries.
+
+Each entry's resource is parsed by its fhir.resources model exactly once and the
+business rules from API_DOCUMENTATION.md run against that parsed model in the
+same step. The bundle envelope itself is only shape-checked; it is never built
+as a fhir.resources Bundle, which would parse every entry a second time.
+"""
+import time
+from typing import Any, Callable, Dict, List, Tuple, Type
+
+from fhir.resources.condition import Condition
+from fhir.resources.observation import Observation
+from fhir.resources.patient import Patient
+
+from metrics import FHIR_VALIDATION_LATENCY
+
+
+class BundleError(ValueError):
+    """The bundle envelope is unusable (wrong type, no entries, malformed entry)."""
+
+
+class UnsupportedResource(ValueError):
+    """The entry holds a resource type this endpoint does not accept."""
+
+
+def _patient_rules(patient: Patient):
+    if not patient.name or not patient.name[0].family or not patient.name[0].given:
+        raise ValueError("Patient name with family and given is required.")
+    if not patient.gender or not patient.birthDate:
+        raise ValueError("Patient gender and birthDate are required.")
+
+
+def _observation_rules(obs: Observation):
+    if not all([obs.status, obs.code, obs.subject, obs.effectiveDateTime, obs.valueQuantity]):
+        raise ValueError("Observation is missing required fields.")
+
+
+def _condition_rules(cond: Condition):
+    if not cond.subject or not cond.code or not (cond.code.coding or cond.code.text):
+        raise ValueError("Condition subject and code (coding or text) are required.")
+
+
+# resourceType -> (model, business rules run on the parsed model)
+VALIDATORS: Dict[str, Tuple[Type, Callable[[Any], None]]] = {
+    "Patient": (Patient, _patient_rules),
+    "Observation": (Observation, _observation_rules),
+    "Condition": (Condition, _condition_rules),
+}
+
+_TIMERS = {resource_type: FHIR_VALIDATION_LATENCY.labels(resource_type) for resource_type in VALIDATORS}
+
+
+def check_transaction_bundle(bundle: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Shape-check a transaction Bundle and return its entries."""
+    if not isinstance(bundle, dict) or bundle.get("resourceType") != "Bundle" or bundle.get("type") != "transaction":
+        raise BundleError("Only transaction bundles are supported")
+    entries = bundle.get("entry")
+    if not entries or not isinstance(entries, list):
+        raise BundleError("Bundle must contain at least one entry")
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not isinstance(entry.get("resource"), dict):
+            raise BundleError(f"Bundle entry {i} must contain a resource")
+    return entries
+
+
+def validate_resource(resource: Dict[str, Any]) -> Any:
+    """
+    Parse and rule-check one resource in a single pass, returning the parsed model.
+    Raises UnsupportedResource for unknown types and ValueError for invalid resources.
+    """
+    resource_type = resource.get("resourceType")
+    validator = VALIDATORS.get(resource_type)
+    if validator is None:
+        raise UnsupportedResource(f"Resource type '{resource_type}' not supported.")
+    model, rules = validator
+    with _TIMERS[resource_type].time():
+        parsed = model.model_validate(resource)
+        rules(parsed)
+    return parsed
+
+
+# Representative valid payloads, one per supported type, used to warm the models
+WARMUP_RESOURCES: Dict[str, Dict[str, Any]] = {
+    "Patient": {
+        "resourceType": "Patient",
+        "id": "warmup",
+        "name": [{"family": "Smith", "given": ["John"]}],
+        "gender": "male",
+        "birthDate": "1970-01-01",
+        "address": [{"line": ["123 Main St"], "city": "Boston", "postalCode": "02115", "country": "USA"}],
+        "telecom": [{"system": "phone", "value": "555-0123"}],
+    },
+    "Observation": {
+        "resourceType": "Observation",
+        "status": "final",
+        "code": {"coding": [{"system": "http://loinc.org", "code": "8480-6", "display": "Systolic blood pressure"}]},
+        "subject": {"reference": "Patient/warmup"},
+        "effectiveDateTime": "2025-09-20T15:30:00Z",
+        "valueQuantity": {"value": 120, "unit": "mmHg", "system": "http://unitsofmeasure.org", "code": "mm[Hg]"},
+    },
+    "Condition": {
+        "resourceType": "Condition",
+        "clinicalStatus": {"coding": [{
+            "system": "http://terminology.hl7.org/CodeSystem/condition-clinical", "code": "active"
+        }]},
+        "code": {"text": "Fever"},
+        "subject": {"reference": "Patient/warmup"},
+    },
+}
+
+
+def warm_up_models() -> Dict[str, float]:
+    """
+    Validates one payload per supported type so the lazily built fhir.resources /
+    pydantic validators are ready before the first request. (No Bundle model is
+    warmed: the envelope is never parsed as one.) The validation timers are bypassed
+    to keep warmup out of the latency metrics. Returns seconds spent per model.
+    """
+    timings: Dict[str, float] = {}
+    for resource_type, (model, rules) in VALIDATORS.items():
+        started = time.perf_counter()
+        rules(model.model_validate(WARMUP_RESOURCES[resource_type]))
+        timings[resource_type] = time.perf_counter() - started
+    return timings
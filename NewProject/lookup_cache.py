@@ -0,0 +1,47 @@
+"""
+Server-side cache of search results, shared by /lookup, /lookup/bulk and the
+Condition auto-coding of /fhir_resource.
+
+Keys include the dataset version, so a reload never serves stale codes. Results
+from a saturated fuzzy stage are never stored.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+from metrics import CACHE_REQUESTS
+
+LOOKUP_RESULT_CACHE_SIZE = int(os.getenv("LOOKUP_RESULT_CACHE_SIZE", "10000"))
+
+
+class LookupCache:
+    """Thread-safe LRU of search results; hits and misses go to cache_requests_total."""
+
+    def __init__(self, maxsize: int = LOOKUP_RESULT_CACHE_SIZE, name: str = "lookup_result"):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hit = CACHE_REQUESTS.labels(name, "hit")
+        self._miss = CACHE_REQUESTS.labels(name, "miss")
+
+    @staticmethod
+    def key(version: str, q_norm: str, top_k: int, threshold: int) -> tuple:
+        return (version, q_norm, top_k, threshold)
+
+    def get(self, key: Hashable) -> Optional[Dict]:
+        with self._lock:
+            result = self._data.get(key)
+            if result is not None:
+                self._data.move_to_end(key)
+        (self._hit if result is not None else self._miss).inc()
+        return result
+
+    def put(self, key: Hashable, result: Dict):
+        if result.get("fuzzy_skipped") or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = result
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
@@ -1,10 +1,47 @@
 import os
+import csv
+import hashlib
+import io
+import threading
+import time
 import unicodedata
+from bisect import bisect_left
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import IO, Dict, Iterator, List, Optional, Tuple
 import pandas as pd
 from rapidfuzz import process, fuzz
 
+from metrics import SEARCH_STAGE_LATENCY, SEARCH_RESULTS
+
+_STAGE_TIMERS = {stage: SEARCH_STAGE_LATENCY.labels(stage) for stage in ("exact", "partial", "fuzzy")}
+_STAGE_RESULTS = {
+    stage: SEARCH_RESULTS.labels(stage) for stage in ("exact", "partial", "fuzzy", "fuzzy_skipped", "none")
+}
+
+# The fuzzy stage scores every row, so only a bounded number of searches may run it
+# at once. A search that cannot get a slot within the queue timeout skips it.
+FUZZY_MAX_CONCURRENCY = int(os.getenv("FUZZY_MAX_CONCURRENCY", str(os.cpu_count() or 2)))
+FUZZY_QUEUE_TIMEOUT = float(os.getenv("FUZZY_QUEUE_TIMEOUT", "0.25"))
+_fuzzy_slots = threading.BoundedSemaphore(FUZZY_MAX_CONCURRENCY)
+
+# A stage event: (stage, seconds) for a stage timing, (stage, None) for a result count
+StageEvent = Tuple[str, Optional[float]]
+
+def _record(stages: Optional[List[StageEvent]], stage: str, seconds: Optional[float] = None):
+    """Report a stage event to the metrics, or collect it in `stages` to report elsewhere."""
+    if stages is not None:
+        stages.append((stage, seconds))
+    elif seconds is None:
+        _STAGE_RESULTS[stage].inc()
+    else:
+        _STAGE_TIMERS[stage].observe(seconds)
+
+def report_stages(stages: List[StageEvent]):
+    """Report stage events collected by a search that ran in another process."""
+    for stage, seconds in stages:
+        _record(None, stage, seconds)
+
 def read_excel_smart(path: str | Path) -> pd.DataFrame:
     """Read Excel file into pandas with engine auto-detection."""
     path = str(path)
@@ -13,6 +50,36 @@ def read_excel_smart(path: str | Path) -> pd.DataFrame:
         return pd.read_excel(path, engine="xlrd")
     return pd.read_excel(path, engine="openpyxl")
 
+def _normalize_header(h) -> str:
+    return "_".join(str(h or "").strip().lower().split())
+
+def iter_table_rows(fileobj: IO[bytes], filename: str) -> Iterator[Dict[str, str]]:
+    """
+    Yield rows of an uploaded CSV/Excel file as dicts keyed by normalized headers,
+    one at a time. CSV and .xlsx are streamed; legacy .xls has to be loaded whole by xlrd.
+    """
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext in ("", ".csv", ".txt"):
+        reader = csv.reader(io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline=""))
+        rows = iter(reader)
+    elif ext == ".xlsx":
+        from openpyxl import load_workbook
+        wb = load_workbook(fileobj, read_only=True, data_only=True)
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+    elif ext == ".xls":
+        import xlrd
+        sheet = xlrd.open_workbook(file_contents=fileobj.read()).sheet_by_index(0)
+        rows = (sheet.row_values(i) for i in range(sheet.nrows))
+    else:
+        raise ValueError(f"Unsupported file type: {ext}")
+
+    header = next(rows, None)
+    if header is None:
+        return
+    keys = [_normalize_header(h) for h in header]
+    for values in rows:
+        yield {k: ("" if v is None else str(v)) for k, v in zip(keys, values)}
+
 def normalize_headers(df: pd.DataFrame) -> pd.DataFrame:
     d = df.copy()
     d.columns = (
@@ -58,23 +125,151 @@ def prepare_unani(df_raw: pd.DataFrame) -> pd.DataFrame:
 def build_search_space(sid: pd.DataFrame, una: pd.DataFrame) -> pd.DataFrame:
     return pd.concat([sid, una], ignore_index=True)
 
+@dataclass
+class SearchIndex:
+    """Siddha + Unani search space prepared once and shared by every query."""
+    base: pd.DataFrame
+    merged: Optional[pd.DataFrame]
+    choices: List[str]
+    version: str
+    # (discipline, code) keys in sorted order with the matching row position in `base`,
+    # used for ordered browsing of the code tables
+    code_keys: List[Tuple[str, str]]
+    code_rows: List[int]
+    # (discipline, code) -> row position in `base`, for O(1) reverse lookup
+    code_map: Dict[Tuple[str, str], int]
+    # (discipline, code) -> first merged crosswalk record mentioning that code
+    merged_by_code: Dict[Tuple[str, str], Dict]
+    # (discipline, code) -> equivalent codes in the other discipline, both directions
+    crosswalk: Dict[Tuple[str, str], List[str]]
+
+MERGED_CODE_COLUMNS = (("Siddha", "siddha_code"), ("Unani", "unani_code"))
+
+_MISSING_CODES = {"", "nan", "none", "null"}
+
+def split_codes(cell: str) -> List[str]:
+    """Split a crosswalk cell such as 'B-72,B-76' or 'F-10/F-11' into codes, dropping 'nan' fillers."""
+    parts = str(cell).replace("/", ",").split(",")
+    return [p.strip() for p in parts if p.strip().lower() not in _MISSING_CODES]
+
+def build_crosswalk(merged: Optional[pd.DataFrame]) -> Dict[Tuple[str, str], List[str]]:
+    """Forward (Siddha -> Unani) and reverse (Unani -> Siddha) code maps from the merged dataset."""
+    out: Dict[Tuple[str, str], List[str]] = {}
+    if merged is None or merged.empty or not {"siddha_code", "unani_code"} <= set(merged.columns):
+        return out
+    for siddha_cell, unani_cell in zip(merged["siddha_code"].tolist(), merged["unani_code"].tolist()):
+        siddha_codes, unani_codes = split_codes(siddha_cell), split_codes(unani_cell)
+        for siddha in siddha_codes:
+            for unani in unani_codes:
+                for key, target in ((("Siddha", siddha), unani), (("Unani", unani), siddha)):
+                    targets = out.setdefault(key, [])
+                    if target not in targets:
+                        targets.append(target)
+    return out
+
+def build_merged_map(merged: Optional[pd.DataFrame]) -> Dict[Tuple[str, str], Dict]:
+    """
+    (discipline, code) -> merged record. Multi-code cells are split as in
+    build_crosswalk, so every code of a cell finds its record.
+    """
+    out: Dict[Tuple[str, str], Dict] = {}
+    if merged is None or merged.empty:
+        return out
+    records = merged.to_dict("records")
+    for discipline, col in MERGED_CODE_COLUMNS:
+        if col not in merged.columns:
+            continue
+        for record in records:
+            for code in split_codes(record[col]):
+                out.setdefault((discipline, code), record)
+    return out
+
+def dataset_version(base: pd.DataFrame, merged: Optional[pd.DataFrame]) -> str:
+    """Content hash of the searchable data; changes whenever any code, label or mapping does."""
+    h = hashlib.sha256()
+    h.update(pd.util.hash_pandas_object(base[["__code_str", "__text"]], index=False).values.tobytes())
+    if merged is not None and not merged.empty:
+        h.update(pd.util.hash_pandas_object(merged.astype(str), index=False).values.tobytes())
+    return h.hexdigest()[:16]
+
+def build_search_index(
+    siddha_df: pd.DataFrame,
+    unani_df: pd.DataFrame,
+    merged_df: Optional[pd.DataFrame]
+) -> SearchIndex:
+    base = build_search_space(prepare_siddha(siddha_df), prepare_unani(unani_df))
+    ordered = sorted(
+        zip(zip(base["__discipline"].tolist(), base["__code_str"].tolist()), range(len(base)))
+    )
+    return SearchIndex(
+        base=base,
+        merged=merged_df,
+        choices=base["__norm"].tolist(),
+        version=dataset_version(base, merged_df),
+        code_keys=[key for key, _ in ordered],
+        code_rows=[pos for _, pos in ordered],
+        code_map={key: pos for key, pos in ordered},
+        merged_by_code=build_merged_map(merged_df),
+        crosswalk=build_crosswalk(merged_df),
+    )
+
+def lookup_code(index: SearchIndex, discipline: str, code: str) -> Optional[Dict]:
+    """Resolve a NAMC/NUMC code to its record with the merged crosswalk attached."""
+    pos = index.code_map.get((discipline, code.strip()))
+    if pos is None:
+        return None
+    row = index.base.iloc[pos]
+    return make_result(row, index.merged_by_code.get((discipline, row["__code_str"])))
+
+def list_codes(
+    index: SearchIndex,
+    discipline: str,
+    prefix: str = "",
+    after: Optional[str] = None,
+    limit: int = 100
+) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Page through one discipline's codes in code order, starting after the code `after`.
+    Returns the page and the last code on it when more codes follow, else None.
+    """
+    start_key = (discipline, prefix if after is None or after < prefix else after)
+    i = bisect_left(index.code_keys, start_key)
+    if after is not None and i < len(index.code_keys) and index.code_keys[i] == (discipline, after):
+        i += 1
+
+    labels = index.base["__text"]
+    page: List[Dict] = []
+    while i < len(index.code_keys) and len(page) <= limit:
+        disc, code = index.code_keys[i]
+        if disc != discipline or not code.startswith(prefix):
+            break
+        page.append({"discipline": disc, "code": code, "label": labels.iat[index.code_rows[i]]})
+        i += 1
+
+    has_more = len(page) > limit
+    page = page[:limit]
+    return page, (page[-1]["code"] if has_more else None)
+
+
 def find_exact(base: pd.DataFrame, q_norm: str) -> Optional[pd.Series]:
     hits = base[base["__norm"] == q_norm]
     return hits.iloc[0] if not hits.empty else None
 
 def find_partial(base: pd.DataFrame, q_norm: str) -> Optional[pd.Series]:
-    hits = base[base["__norm"].str.contains(q_norm, na=False)]
+    hits = base[base["__norm"].str.contains(q_norm, regex=False, na=False)]
     return hits.iloc[0] if not hits.empty else None
 
 def find_fuzzy(
     base: pd.DataFrame,
     q_norm: str,
     top_k: int = 5,
-    threshold: int = 85
+    threshold: int = 85,
+    choices: Optional[List[str]] = None
 ) -> List[Tuple[str, float, int]]:
     if base.empty:
         return []
-    choices = base["__norm"].tolist()
+    if choices is None:
+        choices = base["__norm"].tolist()
     results = process.extract(q_norm, choices, scorer=fuzz.token_sort_ratio, limit=top_k)
     return [(c, float(score), int(idx)) for (c, score, idx) in results if score >= threshold]
 
@@ -96,21 +291,18 @@ def prepare_merged(df_raw: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def lookup_merged(merged: pd.DataFrame, discipline: str, code_str: str) -> Optional[pd.Series]:
-    if merged is None or merged.empty:
-        return None
-    col = "siddha_code" if discipline.lower() == "siddha" else "unani_code"
-    if col not in merged.columns:
-        return None
-    m = merged[merged[col] == code_str.strip()]
-    return m.iloc[0] if not m.empty else None
-
-def make_result(row: pd.Series, merged_row: Optional[pd.Series], suggestions: List[Dict] | None = None) -> Dict:
+def make_result(
+    row: pd.Series,
+    merged_row: Optional[pd.Series | Dict],
+    suggestions: List[Dict] | None = None
+) -> Dict:
+    if isinstance(merged_row, pd.Series):
+        merged_row = merged_row.to_dict()
     return {
         "discipline": row["__discipline"],
         "code": row["__code_str"],
         "label": row["__text"],
-        "merged": merged_row.to_dict() if merged_row is not None else None,
+        "merged": dict(merged_row) if merged_row is not None else None,
         "suggestions": suggestions or []
     }
 
@@ -122,26 +314,67 @@ def search_disease(
     fuzzy_top_k: int = 5,
     fuzzy_threshold: int = 85
 ) -> Dict:
+    index = build_search_index(siddha_df, unani_df, merged_df)
+    return search_with_index(index, disease_name, fuzzy_top_k=fuzzy_top_k, fuzzy_threshold=fuzzy_threshold)
+
+def search_with_index(
+    index: SearchIndex,
+    disease_name: str,
+    fuzzy_top_k: int = 5,
+    fuzzy_threshold: int = 85,
+    fuzzy_admitted: Optional[bool] = None,
+    stages: Optional[List[StageEvent]] = None
+) -> Dict:
+    """
+    Exact, then partial, then fuzzy search. With `fuzzy_admitted` None the fuzzy stage
+    waits for a slot of this process's limiter; True or False means the caller already
+    decided (the search pool admits searches in the API process). Stage metrics are
+    reported directly, or collected into `stages` when given.
+    """
     q_norm = normalize_text(disease_name)
-    sid = prepare_siddha(siddha_df)
-    una = prepare_unani(unani_df)
-    base = build_search_space(sid, una)
+    base = index.base
+    merged_by_code = index.merged_by_code
 
     # exact
+    started = time.perf_counter()
     row = find_exact(base, q_norm)
+    _record(stages, "exact", time.perf_counter() - started)
     if row is not None:
-        m = lookup_merged(merged_df, row["__discipline"], row["__code_str"])
+        _record(stages, "exact")
+        m = merged_by_code.get((row["__discipline"], row["__code_str"]))
         return make_result(row, m)
 
     # partial
+    started = time.perf_counter()
     row = find_partial(base, q_norm)
+    _record(stages, "partial", time.perf_counter() - started)
     if row is not None:
-        m = lookup_merged(merged_df, row["__discipline"], row["__code_str"])
+        _record(stages, "partial")
+        m = merged_by_code.get((row["__discipline"], row["__code_str"]))
         return make_result(row, m)
 
-    # fuzzy → return suggestions
+    # fuzzy → return suggestions, unless the fuzzy stage is saturated
+    if fuzzy_admitted is None:
+        fuzzy_admitted = _fuzzy_slots.acquire(timeout=FUZZY_QUEUE_TIMEOUT)
+        slot = _fuzzy_slots if fuzzy_admitted else None
+    else:
+        slot = None
+    if not fuzzy_admitted:
+        _record(stages, "fuzzy_skipped")
+        return {
+            "error": "No exact/partial match; fuzzy suggestions skipped because the service is busy",
+            "suggestions": [],
+            "fuzzy_skipped": True
+        }
+    try:
+        started = time.perf_counter()
+        matches = find_fuzzy(base, q_norm, top_k=fuzzy_top_k, threshold=fuzzy_threshold, choices=index.choices)
+        _record(stages, "fuzzy", time.perf_counter() - started)
+    finally:
+        if slot is not None:
+            slot.release()
     suggestions_out: List[Dict] = []
-    for choice, score, idx in find_fuzzy(base, q_norm, top_k=fuzzy_top_k, threshold=fuzzy_threshold):
+    for choice, score, idx in matches:
         srow = pick_row_by_index(base, idx)
         if srow is None:
             continue
@@ -153,9 +386,11 @@ def search_disease(
         })
 
     if suggestions_out:
+        _record(stages, "fuzzy")
         return {
             "error": "No exact/partial match; showing fuzzy suggestions",
             "suggestions": suggestions_out
         }
 
+    _record(stages, "none")
     return {"error": "No match found in Siddha or Unani."}
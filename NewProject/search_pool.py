@@ -0,0 +1,89 @@
+"""
+Optional process-pool backend for search.
+
+Each worker process receives the read-only SearchIndex once, at start-up, and
+then runs search_with_index for the API process. This lets a single API process
+use every core for the pandas masking and fuzzy scoring instead of contending
+on the GIL in its thread pool.
+
+Admission to the fuzzy stage is decided here, in the API process, before a
+search is dispatched: a limiter in each single-threaded worker would never be
+contended, and the pool's queue would grow without bound. A search that finds
+no free slot still runs its exact and partial stages, and reports
+`fuzzy_skipped` if it would have needed fuzzy. Workers return their stage
+timings, which are reported to the metrics here.
+"""
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from s import SearchIndex, StageEvent, report_stages, search_with_index
+
+_worker_index: Optional[SearchIndex] = None
+
+def _init_worker(index: SearchIndex):
+    global _worker_index
+    _worker_index = index
+
+def _search(disease_name: str, fuzzy_top_k: int, fuzzy_threshold: int, fuzzy_admitted: bool,
+            stages: List[StageEvent]) -> Dict:
+    return search_with_index(
+        _worker_index, disease_name, fuzzy_top_k=fuzzy_top_k, fuzzy_threshold=fuzzy_threshold,
+        fuzzy_admitted=fuzzy_admitted, stages=stages
+    )
+
+def _search_many(disease_names: List[str], fuzzy_top_k: int, fuzzy_threshold: int,
+                 fuzzy_admitted: bool) -> Tuple[List[Dict], List[StageEvent]]:
+    stages: List[StageEvent] = []
+    results = [_search(name, fuzzy_top_k, fuzzy_threshold, fuzzy_admitted, stages) for name in disease_names]
+    return results, stages
+
+
+class SearchPool:
+    """A pool of worker processes, each holding its own copy of the search index."""
+
+    def __init__(self, index: SearchIndex, workers: int):
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(index,))
+        # At most one fuzzy-capable search (or batch slice) in flight per worker
+        self._fuzzy_slots = threading.BoundedSemaphore(workers)
+
+    async def search(self, disease_name: str, fuzzy_top_k: int = 5, fuzzy_threshold: int = 85) -> Dict:
+        loop = asyncio.get_running_loop()
+        admitted = self._fuzzy_slots.acquire(blocking=False)
+        try:
+            results, stages = await loop.run_in_executor(
+                self._executor, _search_many, [disease_name], fuzzy_top_k, fuzzy_threshold, admitted
+            )
+        finally:
+            if admitted:
+                self._fuzzy_slots.release()
+        report_stages(stages)
+        return results[0]
+
+    def search_many(self, disease_names: List[str], fuzzy_top_k: int = 5, fuzzy_threshold: int = 85) -> List[Dict]:
+        """Blocking batch search, split into one slice per worker."""
+        if not disease_names:
+            return []
+        size = -(-len(disease_names) // self.workers)
+        slices = [disease_names[i:i + size] for i in range(0, len(disease_names), size)]
+        admitted = [self._fuzzy_slots.acquire(blocking=False) for _ in slices]
+        out: List[Dict] = []
+        try:
+            futures = [
+                self._executor.submit(_search_many, part, fuzzy_top_k, fuzzy_threshold, ok)
+                for part, ok in zip(slices, admitted)
+            ]
+            for f in futures:
+                results, stages = f.result()
+                report_stages(stages)
+                out.extend(results)
+        finally:
+            for ok in admitted:
+                if ok:
+                    self._fuzzy_slots.release()
+        return out
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
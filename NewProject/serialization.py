@@ -0,0 +1,32 @@
+from typing import Any
+
+import orjson
+import pandas as pd
+from fastapi.responses import Response
+
+# numpy scalars/arrays coming out of the pandas rows are serialized natively;
+# float NaN/inf become null instead of producing invalid JSON.
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+def _default(obj: Any) -> Any:
+    """Fallback for values orjson does not know: pandas scalars and pydantic models."""
+    if obj is pd.NA or obj is pd.NaT:
+        return None
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json", exclude_none=True)
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def dumps(obj: Any) -> bytes:
+    """Serialize straight to bytes without an intermediate str."""
+    return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+
+class FastJSONResponse(Response):
+    """JSON response rendered with orjson, skipping FastAPI's jsonable_encoder pass."""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,14 +1,26 @@
 import sys
 import logging
 import traceback
-from typing import List, Literal, Any, Dict, Optional    
-from fastapi import FastAPI, HTTPException
+from typing import List, Literal, Any, Dict, Optional, Set, Tuple
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 import json
 from cryptography.fernet import Fernet
 import base64
 import os
+from functools import partial
+from typing import Callable
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from blind_index import SEARCH_PARAMS, BlindIndex
+from db import FHIRResource, find_by_blind_index, get_db, init_db, store_blind_index, store_fhir_resources
+from entry_pool import EntryPool
+from encryption_policy import EncryptionPolicy
+from envelope import DataKey, KeyEncryptionKey, encrypt_resource, new_data_key
+from fhir_processing import entry_location, storage_rows
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -24,6 +36,18 @@ logger = logging.getLogger(__name__)
 ENCRYPTION_KEY = Fernet.generate_key()  # Generate a new key each time the server starts
 fernet = Fernet(ENCRYPTION_KEY)
 
+# "envelope": AES-GCM under a data key wrapped by a persistent key-encryption key
+# (see envelope.py); "fernet": the original per-field Fernet tokens.
+ENCRYPTION_MODE = os.getenv("ENCRYPTION_MODE", "envelope").strip().lower()
+# One data key per bundle (default) or one per Patient resource
+DATA_KEY_SCOPE = os.getenv("DATA_KEY_SCOPE", "bundle").strip().lower()
+kek = KeyEncryptionKey.load_or_create() if ENCRYPTION_MODE == "envelope" else None
+
+# Which fields of which resource types are encrypted (see encryption_policy.py)
+encryption_policy = EncryptionPolicy.from_env()
+# Keyed digests of encrypted fields, for equality search without decryption (see blind_index.py)
+blind_index = BlindIndex.load_or_create()
+
 def encrypt_string(text: str) -> str:
     """Encrypt a string using Fernet symmetric encryption."""
     if not text:
@@ -44,28 +68,15 @@ def decrypt_string(encrypted_text: str) -> str:
     except Exception as e:
         raise ValueError(f"Failed to decrypt string: {str(e)}")
 
-def encrypt_patient_data(patient_resource: Dict[str, Any]) -> Dict[str, Any]:
-    """Encrypt sensitive fields in a Patient resource."""
-    if not isinstance(patient_resource, dict):
-        return patient_resource
-        
-    # Handle name fields
-    if "name" in patient_resource and isinstance(patient_resource["name"], list):
-        for name in patient_resource["name"]:
-            if isinstance(name, dict):
-                if "family" in name:
-                    name["family"] = encrypt_string(name["family"])
-                if "given" in name and isinstance(name["given"], list):
-                    name["given"] = [encrypt_string(g) for g in name["given"]]
-    
-    # Handle address fields
-    if "address" in patient_resource and isinstance(patient_resource["address"], list):
-        for addr in patient_resource["address"]:
-            if isinstance(addr, dict) and "line" in addr and isinstance(addr["line"], list):
-                if addr["line"]:  # Encrypt only the first line
-                    addr["line"][0] = encrypt_string(addr["line"][0])
-    
-    return patient_resource
+def encrypt_resource_data(
+    resource: Dict[str, Any],
+    encrypt: Callable[[str], str] = encrypt_string,
+    observe: Optional[Callable[[str, str], None]] = None
+) -> Dict[str, Any]:
+    """Encrypt the fields named by the encryption policy for this resource type, in place."""
+    if isinstance(resource, dict):
+        encryption_policy.apply(resource, encrypt, observe)
+    return resource
 
 try:
     logger.debug("Initializing FastAPI application...")
@@ -158,11 +169,142 @@ class FHIRResourceRequest(BaseModel):
 def read_root():
     return {"message": "FHIR Converter API running. Try /docs for API documentation."}
 
+def _assign_ids(entries: List[BundleEntry]) -> Dict[str, str]:
+    """
+    Give every resource its server id (same rule as the main app's /fhir_resource)
+    and return the bundle's fullUrl -> "Type/id" map. "Type/id" keys are included as well, so
+    references written in that form to resources of this bundle resolve too.
+    """
+    ref_map: Dict[str, str] = {}
+    for entry in entries:
+        resource = entry.resource
+        location = entry_location(resource.get("resourceType"), {"resource": resource, "fullUrl": entry.fullUrl})
+        ref_map[location] = location
+        if entry.fullUrl:
+            ref_map[entry.fullUrl] = location
+    return ref_map
+
+def _resolve_references(entries: List[BundleEntry], ref_map: Dict[str, str]):
+    """
+    Rewrite every Reference.reference in the bundle to the assigned "Type/id", in one
+    walk over each resource. urn:uuid / urn:oid references are intra-bundle by
+    definition, so one that matches no entry is rejected as dangling.
+    """
+    for i, entry in enumerate(entries):
+        stack: List[Any] = [entry.resource]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                ref = node.get("reference")
+                if isinstance(ref, str):
+                    target = ref_map.get(ref)
+                    if target is not None:
+                        node["reference"] = target
+                    elif ref.startswith(("urn:uuid:", "urn:oid:")):
+                        raise HTTPException(
+                            status_code=400,
+                            detail=f"Entry {i} references '{ref}', which is not in the bundle"
+                        )
+                stack.extend(v for v in node.values() if isinstance(v, (dict, list)))
+            else:
+                stack.extend(v for v in node if isinstance(v, (dict, list)))
+
+def _encrypt_resource(resource: Dict[str, Any], data_key: Optional[DataKey]) -> List[Dict[str, Any]]:
+    """
+    Encrypt the policy's fields of `resource` in place and return its blind index rows,
+    computed from the plaintext in the same pass.
+    """
+    resource_type = resource.get("resourceType")
+    if not encryption_policy.covers(resource_type):
+        return []
+    observed: List[Tuple[str, str]] = []
+    observe = (lambda path, value: observed.append((path, value))) if blind_index.covers(resource_type) else None
+    if ENCRYPTION_MODE != "envelope":
+        encrypt_resource_data(resource, observe=observe)
+    else:
+        encrypt_resource(encryption_policy, resource, kek, data_key, observe)
+    return blind_index.rows(resource_type, resource["id"], observed)
+
+class EntryError(ValueError):
+    """
+    A bundle entry was rejected. Raised in place of HTTPException by code that may run
+    in an EntryPool worker, since HTTPException cannot be pickled back to the server.
+    """
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def _process_entry(entry: BundleEntry, data_key: Optional[DataKey] = None) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Validate one bundle entry, encrypt the policy's fields and build its response entry;
+    returns it with the resource's blind index rows.
+    In envelope mode `data_key` is the bundle's data key, or None for one key per resource.
+    """
+    resource = entry.resource
+    resource_type = resource.get("resourceType")
+
+    # Process based on resource type
+    if resource_type == "Patient":
+        try:
+            Patient(**resource)
+        except Exception as e:
+            raise EntryError(422, f"Invalid Patient resource: {str(e)}")
+
+    elif resource_type == "Observation":
+        try:
+            Observation(**resource)
+        except Exception as e:
+            raise EntryError(422, f"Invalid Observation resource: {str(e)}")
+    else:
+        raise EntryError(400, f"Unsupported resource type: {resource_type}")
+
+    # Encrypt the sensitive fields named by the policy for this resource type
+    index_rows = _encrypt_resource(resource, data_key)
+
+    return {
+        "fullUrl": entry.fullUrl,
+        "resource": resource,
+        "response": {
+            "status": "201",
+            "location": f"{resource_type}/{resource['id']}"
+        }
+    }, index_rows
+
+def _process_entries(
+    entries: List[BundleEntry], data_key: Optional[DataKey] = None
+) -> List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    return [_process_entry(entry, data_key) for entry in entries]
+
+def _init_worker(key: bytes):
+    """Worker processes must encrypt with the server's key, not one generated at their import."""
+    global fernet
+    fernet = Fernet(key)
+
+# Large bundles are validated and encrypted across worker processes
+entry_pool = EntryPool(initializer=_init_worker, initargs=(ENCRYPTION_KEY,))
+
+@app.on_event("startup")
+def on_startup():
+    init_db()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    entry_pool.shutdown()
+
+def _store(db: Session, response_entries: List[Dict[str, Any]], index_rows: List[Dict[str, Any]]):
+    rows = storage_rows(response_entries, {})
+    store_fhir_resources(db, rows)
+    store_blind_index(db, [(r["resource_type"], r["resource_id"]) for r in rows], index_rows)
+    db.commit()
+
 @app.post("/fhir_resource", response_model=Dict[str, Any])
-async def create_fhir_resource(bundle: FHIRResourceRequest):
+async def create_fhir_resource(bundle: FHIRResourceRequest, db: Session = Depends(get_db)):
     """
     Process a FHIR Bundle transaction and create/update resources.
-    Sensitive data in Patient resources will be encrypted before storage.
+    Sensitive data in Patient resources will be encrypted before storage
+    (envelope encryption by default, see ENCRYPTION_MODE).
     """
     try:
         if bundle.type != "transaction":
@@ -171,54 +313,20 @@ async def create_fhir_resource(bundle: FHIRResourceRequest):
                 detail="Only transaction bundles are supported"
             )
 
-        # Process each resource in the bundle
-        processed_resources = []
-        resource_refs = {}
-
-        for entry in bundle.entry:
-            resource = entry.resource
-            resource_type = resource.get("resourceType")
-
-            # Store the resource with its UUID reference if provided
-            if entry.fullUrl:
-                resource_refs[entry.fullUrl] = resource
-
-            # Process based on resource type
-            if resource_type == "Patient":
-                try:
-                    # Validate the Patient resource first
-                    Patient(**resource)
-                    # Encrypt sensitive patient data
-                    resource = encrypt_patient_data(resource)
-                except Exception as e:
-                    raise HTTPException(
-                        status_code=422,
-                        detail=f"Invalid Patient resource: {str(e)}"
-                    )
-
-            elif resource_type == "Observation":
-                try:
-                    Observation(**resource)
-                except Exception as e:
-                    raise HTTPException(
-                        status_code=422,
-                        detail=f"Invalid Observation resource: {str(e)}"
-                    )
-            else:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Unsupported resource type: {resource_type}"
-                )
-
-            # Add processed resource to response
-            processed_resources.append({
-                "fullUrl": entry.fullUrl,
-                "resource": resource,
-                "response": {
-                    "status": "201",
-                    "location": f"{resource_type}/{resource.get('id', 'new')}"
-                }
-            })
+        # Assign ids, then point every intra-bundle reference at them
+        ref_map = _assign_ids(bundle.entry)
+        _resolve_references(bundle.entry, ref_map)
+
+        # One data key for the whole bundle: generated and wrapped once, shared by every Patient
+        data_key = new_data_key(kek) if ENCRYPTION_MODE == "envelope" and DATA_KEY_SCOPE == "bundle" else None
+
+        # Process the entries, in parallel for large bundles; order is preserved
+        processed = await entry_pool.map_async(partial(_process_entries, data_key=data_key), bundle.entry)
+        processed_resources = [response_entry for response_entry, _ in processed]
+        index_rows = [row for _, rows in processed for row in rows]
+
+        # The encrypted resources and their blind index are written in one transaction
+        await run_in_threadpool(_store, db, processed_resources, index_rows)
 
         # Create response bundle
         response_bundle = {
@@ -229,6 +337,8 @@ async def create_fhir_resource(bundle: FHIRResourceRequest):
 
         return response_bundle
 
+    except EntryError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except HTTPException as he:
         raise he
     except Exception as e:
@@ -243,4 +353,64 @@ async def create_fhir_resource(bundle: FHIRResourceRequest):
         type="collection",
         entry=[{"resource": r.dict()} for r in resources]
     )
-    return json.loads(bundle.json())    
\ No newline at end of file
+    return json.loads(bundle.json())
+
+def _matching_ids(db: Session, resource_type: str, param: str, value: str) -> Set[str]:
+    """Ids matching one search parameter: for any of its fields, every digest of the value."""
+    ids: Set[str] = set()
+    for field, digests in blind_index.query(resource_type, param, value).items():
+        if not digests:
+            continue
+        field_ids = find_by_blind_index(db, resource_type, [field], digests[0])
+        for digest in digests[1:]:
+            if not field_ids:
+                break
+            field_ids &= find_by_blind_index(db, resource_type, [field], digest)
+        ids |= field_ids
+    return ids
+
+@app.get("/Patient")
+def search_patients(request: Request, db: Session = Depends(get_db)):
+    """
+    Exact-match search on encrypted Patient fields: family, given, name, phone/telecom
+    and address (every word must match). Matching is case- and accent-insensitive and
+    ignores phone formatting. Parameters are combined with AND.
+
+    The query values are HMAC'd and looked up in the blind index, so no record is
+    decrypted; the matching resources are returned as stored, still encrypted.
+    """
+    params = SEARCH_PARAMS["Patient"]
+    unknown = [k for k in request.query_params if k not in params]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unsupported search parameter(s): {', '.join(unknown)}")
+    criteria = [(k, v) for k, v in request.query_params.multi_items() if v.strip()]
+    if not criteria:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At least one search parameter is required: {', '.join(params)}"
+        )
+
+    ids: Optional[Set[str]] = None
+    for param, value in criteria:
+        matched = _matching_ids(db, "Patient", param, value)
+        ids = matched if ids is None else ids & matched
+        if not ids:
+            break
+
+    resources = []
+    if ids:
+        query = select(FHIRResource.resource_json).where(
+            FHIRResource.resource_type == "Patient",
+            FHIRResource.resource_id.in_(sorted(ids)),
+        ).order_by(FHIRResource.resource_id)
+        resources = list(db.execute(query).scalars())
+
+    return {
+        "resourceType": "Bundle",
+        "type": "searchset",
+        "total": len(resources),
+        "entry": [
+            {"fullUrl": f"Patient/{r['id']}", "resource": r, "search": {"mode": "match"}}
+            for r in resources
+        ],
+    }
@@ -0,0 +1,333 @@
+"""
+FHIR terminology operations ($lookup, $expand, $validate-code, $translate) over the
+NAMC/NUMC search index.
+
+Everything is answered from the in-memory SearchIndex. ValueSet expansions are
+computed once per (dataset version, value set, filter) and kept in a small LRU
+cache, so paging through a pick-list only slices an already built list. The
+Siddha<->Unani ConceptMap is compiled once at load time, with every $translate
+answer prepared in a hash map keyed by (source system, code).
+"""
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from metrics import CACHE_REQUESTS
+from s import SearchIndex, lookup_code, normalize_text
+
+TERMINOLOGY_BASE_URL = os.getenv("TERMINOLOGY_BASE_URL", "http://example.org/fhir").rstrip("/")
+EXPANSION_CACHE_SIZE = int(os.getenv("EXPANSION_CACHE_SIZE", "256"))
+
+# discipline -> CodeSystem canonical URL
+CODE_SYSTEMS: Dict[str, str] = {
+    "Siddha": f"{TERMINOLOGY_BASE_URL}/CodeSystem/namc-siddha",
+    "Unani": f"{TERMINOLOGY_BASE_URL}/CodeSystem/numc-unani",
+}
+SYSTEM_DISCIPLINES = {url: discipline for discipline, url in CODE_SYSTEMS.items()}
+SYSTEM_NAMES = {"Siddha": "NAMC Siddha Morbidity Codes", "Unani": "NUMC Unani Morbidity Codes"}
+
+# ValueSet canonical URL -> disciplines whose codes it contains
+VALUE_SETS: Dict[str, Tuple[str, ...]] = {
+    f"{TERMINOLOGY_BASE_URL}/ValueSet/namc-siddha": ("Siddha",),
+    f"{TERMINOLOGY_BASE_URL}/ValueSet/numc-unani": ("Unani",),
+    f"{TERMINOLOGY_BASE_URL}/ValueSet/ayush-morbidity": ("Siddha", "Unani"),
+}
+VALUE_SETS_BY_DISCIPLINE = {disciplines[0]: url for url, disciplines in VALUE_SETS.items() if len(disciplines) == 1}
+
+
+class UnknownSystem(ValueError):
+    """The requested CodeSystem or ValueSet is not served here."""
+
+
+def discipline_for_system(system: Optional[str]) -> str:
+    discipline = SYSTEM_DISCIPLINES.get((system or "").strip())
+    if discipline is None:
+        raise UnknownSystem(f"Unknown code system '{system}'")
+    return discipline
+
+
+def value_set_disciplines(url: Optional[str]) -> Tuple[str, ...]:
+    disciplines = VALUE_SETS.get((url or "").strip())
+    if disciplines is None:
+        raise UnknownSystem(f"Unknown value set '{url}'")
+    return disciplines
+
+
+def _parameters(*params: Dict) -> Dict:
+    return {"resourceType": "Parameters", "parameter": list(params)}
+
+
+def lookup_concept(index: SearchIndex, system: str, code: str) -> Optional[Dict]:
+    """CodeSystem/$lookup: a Parameters resource for the code, or None if it is unknown."""
+    discipline = discipline_for_system(system)
+    record = lookup_code(index, discipline, code)
+    if record is None:
+        return None
+    params = [
+        {"name": "name", "valueString": SYSTEM_NAMES[discipline]},
+        {"name": "version", "valueString": index.version},
+        {"name": "display", "valueString": record["label"]},
+    ]
+    # Crosswalk equivalents are reported as properties carrying a Coding of the other system
+    for other, url in CODE_SYSTEMS.items():
+        if other == discipline:
+            continue
+        for target in index.crosswalk.get((discipline, record["code"]), []):
+            params.append({"name": "property", "part": [
+                {"name": "code", "valueCode": "equivalent"},
+                {"name": "value", "valueCoding": {"system": url, "code": target}},
+            ]})
+    return _parameters(*params)
+
+
+def validate_code(
+    index: SearchIndex,
+    system: str,
+    code: str,
+    display: Optional[str] = None,
+    value_set: Optional[str] = None
+) -> Dict:
+    """$validate-code for a CodeSystem, or for a ValueSet when `value_set` is given."""
+    discipline = discipline_for_system(system)
+    if value_set is not None and discipline not in value_set_disciplines(value_set):
+        return _parameters(
+            {"name": "result", "valueBoolean": False},
+            {"name": "message", "valueString": f"Code system '{system}' is not part of value set '{value_set}'"},
+        )
+
+    record = lookup_code(index, discipline, code)
+    if record is None:
+        return _parameters(
+            {"name": "result", "valueBoolean": False},
+            {"name": "message", "valueString": f"Unknown code '{code}' in code system '{system}'"},
+        )
+    if display is not None and normalize_text(display) != normalize_text(record["label"]):
+        return _parameters(
+            {"name": "result", "valueBoolean": False},
+            {"name": "message", "valueString": f"Display '{display}' does not match '{record['label']}'"},
+            {"name": "display", "valueString": record["label"]},
+        )
+    return _parameters(
+        {"name": "result", "valueBoolean": True},
+        {"name": "display", "valueString": record["label"]},
+    )
+
+
+_expansions: "OrderedDict[tuple, List[int]]" = OrderedDict()
+_expansions_lock = threading.Lock()
+
+
+def _matching_rows(index: SearchIndex, disciplines: Tuple[str, ...], filter_norm: str) -> List[int]:
+    """Row positions (in code order) whose label contains every filter word, or whose code starts with the filter."""
+    words = filter_norm.split()
+    code_prefix = filter_norm.upper()
+    rows = []
+    for (discipline, code), pos in zip(index.code_keys, index.code_rows):
+        if discipline not in disciplines:
+            continue
+        label = index.choices[pos]
+        if not words or all(w in label for w in words) or code.upper().startswith(code_prefix):
+            rows.append(pos)
+    return rows
+
+
+def _expansion_rows(index: SearchIndex, disciplines: Tuple[str, ...], filter_norm: str) -> List[int]:
+    key = (index.version, disciplines, filter_norm)
+    with _expansions_lock:
+        rows = _expansions.get(key)
+        if rows is not None:
+            _expansions.move_to_end(key)
+    if rows is not None:
+        CACHE_REQUESTS.labels("valueset_expand", "hit").inc()
+        return rows
+
+    CACHE_REQUESTS.labels("valueset_expand", "miss").inc()
+    rows = _matching_rows(index, disciplines, filter_norm)
+    with _expansions_lock:
+        _expansions[key] = rows
+        while len(_expansions) > EXPANSION_CACHE_SIZE:
+            _expansions.popitem(last=False)
+    return rows
+
+
+def expand_value_set(
+    index: SearchIndex,
+    url: str,
+    filter_text: str = "",
+    offset: int = 0,
+    count: int = 100
+) -> Dict:
+    """ValueSet/$expand: one page of the (cached) filtered expansion as a ValueSet resource."""
+    disciplines = value_set_disciplines(url)
+    filter_norm = normalize_text(filter_text or "")
+    rows = _expansion_rows(index, disciplines, filter_norm)
+
+    base = index.base
+    contains = [
+        {
+            "system": CODE_SYSTEMS[base["__discipline"].iat[pos]],
+            "code": base["__code_str"].iat[pos],
+            "display": base["__text"].iat[pos],
+        }
+        for pos in rows[offset:offset + count]
+    ]
+    parameter = [{"name": "offset", "valueInteger": offset}, {"name": "count", "valueInteger": count}]
+    if filter_text:
+        parameter.insert(0, {"name": "filter", "valueString": filter_text})
+    return {
+        "resourceType": "ValueSet",
+        "url": url,
+        "status": "active",
+        "expansion": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "total": len(rows),
+            "offset": offset,
+            "parameter": parameter,
+            "contains": contains,
+        },
+    }
+
+
+CONCEPT_MAP_ID = "siddha-unani"
+CONCEPT_MAP_URL = f"{TERMINOLOGY_BASE_URL}/ConceptMap/{CONCEPT_MAP_ID}"
+
+
+@dataclass
+class CompiledConceptMap:
+    """The Siddha<->Unani ConceptMap resource plus its $translate answers, both built once."""
+    resource: Dict
+    # (source system, code) -> ready-made `match` parameters, one per target concept
+    matches: Dict[Tuple[str, str], List[Dict]]
+
+
+def _without_none(d: Dict) -> Dict:
+    return {k: v for k, v in d.items() if v is not None}
+
+
+def build_concept_map(index: SearchIndex) -> CompiledConceptMap:
+    """Compile the merged-dataset crosswalk into a ConceptMap and a hash map of $translate matches."""
+    labels = index.base["__text"]
+
+    def display(discipline: str, code: str) -> Optional[str]:
+        pos = index.code_map.get((discipline, code))
+        return labels.iat[pos] if pos is not None else None
+
+    groups: Dict[str, Dict] = {}
+    matches: Dict[Tuple[str, str], List[Dict]] = {}
+    for (discipline, code), targets in sorted(index.crosswalk.items()):
+        other = "Unani" if discipline == "Siddha" else "Siddha"
+        source_url, target_url = CODE_SYSTEMS[discipline], CODE_SYSTEMS[other]
+        group = groups.setdefault(discipline, {"source": source_url, "target": target_url, "element": []})
+        element = _without_none({"code": code, "display": display(discipline, code), "target": []})
+        match_params = []
+        for target in targets:
+            coding = _without_none({"system": target_url, "code": target, "display": display(other, target)})
+            element["target"].append(_without_none(
+                {"code": target, "display": coding.get("display"), "relationship": "equivalent"}
+            ))
+            match_params.append({"name": "match", "part": [
+                {"name": "relationship", "valueCode": "equivalent"},
+                {"name": "concept", "valueCoding": coding},
+                {"name": "originMap", "valueCanonical": CONCEPT_MAP_URL},
+            ]})
+        group["element"].append(element)
+        matches[(source_url, code)] = match_params
+
+    resource = {
+        "resourceType": "ConceptMap",
+        "id": CONCEPT_MAP_ID,
+        "url": CONCEPT_MAP_URL,
+        "version": index.version,
+        "name": "SiddhaUnaniCrosswalk",
+        "status": "active",
+        "sourceScopeUri": VALUE_SETS_BY_DISCIPLINE["Siddha"],
+        "targetScopeUri": VALUE_SETS_BY_DISCIPLINE["Unani"],
+        "group": [groups[d] for d in ("Siddha", "Unani") if d in groups],
+    }
+    return CompiledConceptMap(resource=resource, matches=matches)
+
+
+def translate_concept(
+    concept_map: CompiledConceptMap,
+    system: str,
+    code: str,
+    target_system: Optional[str] = None
+) -> Dict:
+    """ConceptMap/$translate for one source code: a Parameters resource with result and matches."""
+    discipline_for_system(system)
+    if target_system is not None:
+        discipline_for_system(target_system)
+    code = (code or "").strip()
+    matches = concept_map.matches.get((system.strip(), code), [])
+    if target_system is not None and target_system.strip() == system.strip():
+        matches = []
+    if matches:
+        return _parameters({"name": "result", "valueBoolean": True}, *matches)
+    return _parameters(
+        {"name": "result", "valueBoolean": False},
+        {"name": "message", "valueString": f"No mapping for code '{code}' in '{system}'"},
+    )
+
+
+# R5 $translate input names, with their R4 spellings
+_SOURCE_CODE = ("sourceCode", "code")
+_SOURCE_SYSTEM = ("sourceSystem", "system")
+_SOURCE_CODING = ("sourceCoding", "coding")
+_TARGET_SYSTEM = ("targetSystem", "targetsystem")
+
+
+def translate_parameters(concept_map: CompiledConceptMap, params: Dict) -> Dict:
+    """
+    $translate with a Parameters body. A single sourceCode/sourceSystem pair gets the
+    standard response; several sourceCoding parameters are translated as one batch,
+    answered with one `translation` parameter per input coding, in input order.
+    """
+    if not isinstance(params, dict) or params.get("resourceType") != "Parameters":
+        raise ValueError("Request body must be a Parameters resource")
+    target_system = None
+    system = None
+    code = None
+    codings: List[Dict] = []
+    parameters = params.get("parameter") or []
+    if not isinstance(parameters, list) or not all(isinstance(p, dict) for p in parameters):
+        raise ValueError("Parameters.parameter must be a list of objects")
+    for param in parameters:
+        name = param.get("name")
+        if name in _SOURCE_CODING:
+            coding = param.get("valueCoding") or {}
+            if not isinstance(coding, dict):
+                raise ValueError(f"{name} must have a valueCoding object")
+            codings.append(coding)
+        elif name in _SOURCE_CODE:
+            code = param.get("valueCode")
+        elif name in _SOURCE_SYSTEM:
+            system = param.get("valueUri")
+        elif name in _TARGET_SYSTEM:
+            target_system = param.get("valueUri")
+    if code is not None:
+        codings.append({"system": system, "code": code})
+    if not codings:
+        raise ValueError("Provide sourceCode with sourceSystem, or one or more sourceCoding parameters")
+    values = [target_system, *(c.get(k) for c in codings for k in ("system", "code"))]
+    if not all(v is None or isinstance(v, str) for v in values):
+        raise ValueError("Code and system values must be strings")
+
+    if len(codings) == 1:
+        return translate_concept(concept_map, codings[0].get("system"), codings[0].get("code"), target_system)
+    translations = []
+    if target_system is not None:
+        discipline_for_system(target_system)
+    for coding in codings:
+        try:
+            result = translate_concept(concept_map, coding.get("system"), coding.get("code"), target_system)
+        except UnknownSystem as e:
+            # One bad coding should not fail the rest of the batch
+            result = _parameters({"name": "result", "valueBoolean": False}, {"name": "message", "valueString": str(e)})
+        translations.append({"name": "translation", "part": [
+            {"name": "sourceCoding", "valueCoding": {"system": coding.get("system"), "code": coding.get("code")}},
+            *result["parameter"],
+        ]})
+    return _parameters(*translations)
@@ -0,0 +1,88 @@
+import requests
+import uuid
+
+from blind_index import normalize_telecom
+from encryption_policy import EncryptionPolicy
+from envelope import KeyEncryptionKey, open_data_key, wrapped_key_of
+
+BASE_URL = "http://127.0.0.1:8000"
+
+# Run from the server's directory (or with the same KEK_PATH / ENVELOPE_KEK) against
+# simple_app in its default envelope mode, so the stored fields can be decrypted here.
+
+def _patient(family, given, phone, line):
+    return {
+        "fullUrl": f"urn:uuid:{uuid.uuid4()}",
+        "resource": {
+            "resourceType": "Patient",
+            "name": [{"family": family, "given": given}],
+            "gender": "female",
+            "birthDate": "1988-08-08",
+            "address": [{"line": [line], "city": "Chennai", "state": "TN", "postalCode": "600001", "country": "IN"}],
+            "telecom": [{"system": "phone", "value": phone}]
+        },
+        "request": {"method": "POST", "url": "Patient"}
+    }
+
+def _search(**params):
+    response = requests.get(f"{BASE_URL}/Patient", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_blind_index():
+    print("Testing blind index search on encrypted Patients...")
+
+    # A family name unique to this run, so earlier runs do not match
+    family = f"Iyer{uuid.uuid4().hex[:6]}"
+    bundle = {
+        "resourceType": "Bundle",
+        "type": "transaction",
+        "entry": [
+            _patient(family, ["Lakshmī"], "+91 98765-43210", "12 MG Road"),
+            _patient(family, ["Priya"], "9876500000", "5 Park Street"),
+            # A phone number that went through a float on its way in
+            _patient(family, ["Meena"], "9876511111.0", "7 Lake View"),
+        ]
+    }
+    response = requests.post(f"{BASE_URL}/fhir_resource", json=bundle)
+    assert response.status_code == 200, response.text
+    stored_family = response.json()["entry"][0]["resource"]["name"][0]["family"]
+    print(f"\nStored family name: {stored_family}")
+    assert stored_family != family
+
+    # Equality search, case-insensitive, without any decryption on the server
+    result = _search(family=family.upper())
+    print(f"family={family.upper()}: {result['total']} match(es)")
+    assert result["type"] == "searchset" and result["total"] == 3
+
+    # Accent-insensitive given name, phone by digits only, address by words, ANDed parameters
+    assert _search(family=family, given="lakshmi")["total"] == 1
+    assert _search(family=family, phone="919876543210")["total"] == 1
+    assert _search(family=family, address="road mg")["total"] == 1
+    assert _search(family=family, given="Priya", address="road")["total"] == 0
+
+    # "9876511111.0" is indexed as 9876511111, without the float's trailing zero
+    assert normalize_telecom("9876511111.0") == normalize_telecom("+9876511111") == "9876511111"
+    assert normalize_telecom("555.0123") == "5550123"
+    assert _search(family=family, phone="9876511111")["total"] == 1
+    assert _search(family=family, phone="98765111110")["total"] == 0
+
+    # The matches come back still encrypted; the wrapped data key opens them
+    kek = KeyEncryptionKey.load_or_create()
+    policy = EncryptionPolicy.from_env()
+    decrypted = []
+    for entry in _search(family=family, given="priya")["entry"]:
+        resource = entry["resource"]
+        data_key = open_data_key(kek, wrapped_key_of(resource))
+        policy.apply_by_path(resource, data_key.field_decryptor(resource))
+        decrypted.append(resource)
+    print(f"Decrypted: {decrypted[0]['name']} {decrypted[0]['telecom'][0]['value']}")
+    assert decrypted[0]["name"][0] == {"family": family, "given": ["Priya"]}
+    assert decrypted[0]["address"][0]["line"] == ["5 Park Street"]
+
+    # At least one known search parameter is required
+    assert requests.get(f"{BASE_URL}/Patient").status_code == 400
+    assert requests.get(f"{BASE_URL}/Patient", params={"birthdate": "1988-08-08"}).status_code == 400
+
+if __name__ == "__main__":
+    test_blind_index()
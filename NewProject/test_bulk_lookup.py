@@ -0,0 +1,48 @@
+import requests
+import json
+
+BASE_URL = "http://127.0.0.1:8000"
+
+def test_bulk_lookup():
+    print("Testing streaming bulk coding endpoint...")
+
+    diagnoses = ["Fever", "Feverr", "Scar marks", "Dryness of skin", "Fever"]
+    csv_body = "diagnosis\n" + "\n".join(diagnoses)
+
+    # NDJSON: results arrive line by line while the file is still being coded
+    with requests.post(
+        f"{BASE_URL}/lookup/bulk",
+        files={"file": ("diagnoses.csv", csv_body, "text/csv")},
+        stream=True
+    ) as response:
+        print(f"\nNDJSON status: {response.status_code}")
+        for line in response.iter_lines():
+            if line:
+                record = json.loads(line)
+                print(record["row"], record["disease_text"], "->", record["result"].get("code"))
+
+    # CSV output
+    response = requests.post(
+        f"{BASE_URL}/lookup/bulk",
+        params={"format": "csv", "column": "diagnosis"},
+        files={"file": ("diagnoses.csv", csv_body, "text/csv")}
+    )
+    print(f"\nCSV status: {response.status_code}")
+    print(response.text)
+
+    # Texts are matched literally: regex metacharacters must not cut the stream short
+    diagnoses = ["Fever", "Pain (chronic", "Fever [high", "a+b*c?", "Scar marks"]
+    csv_body = "diagnosis\n" + "\n".join(diagnoses)
+    response = requests.post(
+        f"{BASE_URL}/lookup/bulk",
+        files={"file": ("diagnoses.csv", csv_body, "text/csv")}
+    )
+    records = [json.loads(line) for line in response.text.splitlines() if line]
+    print(f"\nMetacharacter rows: {response.status_code}, {len(records)} of {len(diagnoses)} rows")
+    assert response.status_code == 200
+    assert [r["disease_text"] for r in records] == diagnoses
+    assert not any(r["result"].get("search_failed") for r in records)
+    assert records[0]["result"].get("code")
+
+if __name__ == "__main__":
+    test_bulk_lookup()
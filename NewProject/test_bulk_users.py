@@ -0,0 +1,34 @@
+import requests
+import uuid
+from pprint import pprint
+
+BASE_URL = "http://127.0.0.1:8000"
+
+def test_bulk_users():
+    print("Testing bulk user provisioning...")
+
+    suffix = uuid.uuid4().hex[:6]
+    users = [
+        {"username": f"doctor_{suffix}", "email": f"doctor_{suffix}@example.com"},
+        {"username": f"nurse_{suffix}", "email": f"nurse_{suffix}@example.com"},
+        # Duplicate username within the same batch -> reported as a conflict
+        {"username": f"doctor_{suffix}", "email": f"other_{suffix}@example.com"},
+    ]
+
+    response = requests.post(f"{BASE_URL}/users/bulk", json=users)
+    print(f"\nJSON upload status: {response.status_code}")
+    result = response.json()
+    pprint(result)
+    print(f"Created {len(result['created'])}, conflicts {len(result['conflicts'])}")
+
+    # Same users again via CSV -> everything conflicts, nothing is aborted
+    csv_body = "username,email\n" + "\n".join(f"{u['username']},{u['email']}" for u in users[:2])
+    response = requests.post(
+        f"{BASE_URL}/users/bulk/csv",
+        files={"file": ("users.csv", csv_body, "text/csv")}
+    )
+    print(f"\nCSV upload status: {response.status_code}")
+    pprint(response.json())
+
+if __name__ == "__main__":
+    test_bulk_users()
@@ -0,0 +1,80 @@
+import requests
+import uuid
+
+BASE_URL = "http://127.0.0.1:8000"
+
+def _bundle(patient_url, subject_reference, patient_id=None):
+    patient = {
+        "resourceType": "Patient",
+        "name": [{"family": "Reference", "given": ["Test"]}],
+        "gender": "female",
+        "birthDate": "1992-02-02"
+    }
+    if patient_id:
+        patient["id"] = patient_id
+    return {
+        "resourceType": "Bundle",
+        "type": "transaction",
+        "entry": [
+            {"fullUrl": patient_url, "resource": patient, "request": {"method": "POST", "url": "Patient"}},
+            {
+                "fullUrl": f"urn:uuid:{uuid.uuid4()}",
+                "resource": {
+                    "resourceType": "Observation",
+                    "status": "final",
+                    "code": {"coding": [{"system": "http://loinc.org", "code": "8867-4", "display": "Heart rate"}]},
+                    "subject": {"reference": subject_reference},
+                    "effectiveDateTime": "2024-01-01T10:00:00Z",
+                    "valueQuantity": {"value": 72, "unit": "beats/minute", "code": "/min"}
+                },
+                "request": {"method": "POST", "url": "Observation"}
+            }
+        ]
+    }
+
+def test_bundle_references():
+    print("Testing intra-bundle reference rewriting...")
+
+    # urn:uuid fullUrl -> the Patient's id is the uuid, and the reference is rewritten to it
+    patient_uuid = str(uuid.uuid4())
+    response = requests.post(
+        f"{BASE_URL}/fhir_resource",
+        json=_bundle(f"urn:uuid:{patient_uuid}", f"urn:uuid:{patient_uuid}")
+    )
+    entries = response.json()["entry"]
+    subject = entries[1]["resource"]["subject"]["reference"]
+    print(f"\nurn:uuid reference: {response.status_code} -> {subject}")
+    assert response.status_code == 200
+    assert entries[0]["response"]["location"] == f"Patient/{patient_uuid}"
+    assert subject == f"Patient/{patient_uuid}"
+
+    # A Patient with its own id: references to its fullUrl point at that id
+    patient_id = f"ref-{uuid.uuid4().hex[:8]}"
+    patient_uuid = str(uuid.uuid4())
+    response = requests.post(
+        f"{BASE_URL}/fhir_resource",
+        json=_bundle(f"urn:uuid:{patient_uuid}", f"urn:uuid:{patient_uuid}", patient_id=patient_id)
+    )
+    subject = response.json()["entry"][1]["resource"]["subject"]["reference"]
+    print(f"Reference to a resource with an id: {response.status_code} -> {subject}")
+    assert subject == f"Patient/{patient_id}"
+
+    # A urn:uuid that matches no entry is dangling and rejects the bundle
+    response = requests.post(
+        f"{BASE_URL}/fhir_resource",
+        json=_bundle(f"urn:uuid:{uuid.uuid4()}", f"urn:uuid:{uuid.uuid4()}")
+    )
+    print(f"Dangling urn:uuid: {response.status_code} {response.json()}")
+    assert response.status_code == 400
+
+    # Plain Type/id references to resources outside the bundle are left alone
+    response = requests.post(
+        f"{BASE_URL}/fhir_resource",
+        json=_bundle(f"urn:uuid:{uuid.uuid4()}", "Patient/existing-patient")
+    )
+    subject = response.json()["entry"][1]["resource"]["subject"]["reference"]
+    print(f"External reference: {response.status_code} -> {subject}")
+    assert response.status_code == 200 and subject == "Patient/existing-patient"
+
+if __name__ == "__main__":
+    test_bundle_references()
@@ -0,0 +1,30 @@
+import requests
+
+BASE_URL = "http://127.0.0.1:8000"
+
+def test_code_crosswalk():
+    print("Testing multi-code crosswalk cells...")
+
+    # merged_dataset.xlsx maps Unani 'F-10/F-11' to Siddha EGC1.1 in one cell: each code
+    # must find the merged record, and agree with /translate
+    for code in ("F-10", "F-11"):
+        looked_up = requests.get(f"{BASE_URL}/code/unani/{code}").json()
+        translated = requests.get(f"{BASE_URL}/translate/unani/{code}").json()
+        merged = looked_up.get("merged")
+        print(f"\n{code}: merged siddha_code={merged and merged['siddha_code']}, translate={translated.get('equivalents')}")
+        assert merged is not None, f"/code/unani/{code} has no merged record"
+        assert merged["siddha_code"] in translated["equivalents"]
+
+    # The reverse direction: EGC1.1 translates to both codes of the cell
+    translated = requests.get(f"{BASE_URL}/translate/siddha/EGC1.1").json()
+    print(f"EGC1.1 -> {translated.get('equivalents')}")
+    assert {"F-10", "F-11"} <= set(translated["equivalents"])
+
+    # Comma-separated cells ('B-72,B-76') are split the same way
+    for code in ("B-72", "B-76"):
+        merged = requests.get(f"{BASE_URL}/code/unani/{code}").json().get("merged")
+        print(f"{code}: merged unani_code={merged and merged['unani_code']}")
+        assert merged is not None
+
+if __name__ == "__main__":
+    test_code_crosswalk()
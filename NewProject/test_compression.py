@@ -0,0 +1,63 @@
+import requests
+import uuid
+
+BASE_URL = "http://127.0.0.1:8000"
+
+def _bundle(n):
+    return {
+        "resourceType": "Bundle",
+        "type": "transaction",
+        "entry": [
+            {
+                "fullUrl": f"urn:uuid:{uuid.uuid4()}",
+                "resource": {
+                    "resourceType": "Patient",
+                    "name": [{"family": "Compress", "given": ["Test"]}],
+                    "gender": "male",
+                    "birthDate": "1975-03-03"
+                },
+                "request": {"method": "POST", "url": "Patient"}
+            }
+            for _ in range(n)
+        ]
+    }
+
+def _post(accept_encoding, n=20):
+    # stream=True leaves the body undecoded, so the raw Content-Encoding can be checked
+    return requests.post(
+        f"{BASE_URL}/fhir_resource",
+        json=_bundle(n),
+        headers={"Accept-Encoding": accept_encoding},
+        stream=True
+    )
+
+def test_compression():
+    print("Testing Accept-Encoding negotiation...")
+
+    # Server preference zstd > br > gzip, among what the client accepts with q > 0
+    cases = [
+        ("gzip", "gzip"),
+        ("gzip, br", "br"),
+        ("gzip, br, zstd", "zstd"),
+        ("br;q=0, gzip", "gzip"),
+        ("*", "zstd"),
+        ("identity", None),
+    ]
+    for accept, expected in cases:
+        response = _post(accept)
+        encoding = response.headers.get("Content-Encoding")
+        vary = response.headers.get("Vary")
+        print(f"{accept!r:>18} -> {encoding} (Vary: {vary})")
+        assert response.status_code == 200
+        # brotli and zstandard are optional; without them the server falls back to gzip
+        assert encoding == expected or (expected in ("br", "zstd") and encoding in ("br", "gzip"))
+        if encoding:
+            assert vary is not None and vary.lower().count("accept-encoding") == 1
+
+    # Responses under COMPRESSION_MIN_SIZE are sent as they are
+    response = _post("gzip", n=1)
+    print(f"\nSmall response encoding: {response.headers.get('Content-Encoding')}")
+    assert response.headers.get("Content-Encoding") is None
+
+if __name__ == "__main__":
+    test_compression()
@@ -0,0 +1,38 @@
+import requests
+import uuid
+
+BASE_URL = "http://127.0.0.1:8000"
+
+def _condition(text):
+    return {
+        "fullUrl": f"urn:uuid:{uuid.uuid4()}",
+        "resource": {
+            "resourceType": "Condition",
+            "clinicalStatus": {"coding": [{
+                "system": "http://terminology.hl7.org/CodeSystem/condition-clinical", "code": "active"
+            }]},
+            "code": {"text": text},
+            "subject": {"reference": "Patient/example"}
+        },
+        "request": {"method": "POST", "url": "Condition"}
+    }
+
+def test_condition_autocoding():
+    print("Testing Condition auto-coding...")
+
+    # Search text is matched literally: regex metacharacters must not break the bundle
+    texts = ["Fever", "Fever (high", "Pain [chronic", "a+b*c?", "\\d+"]
+    bundle = {"resourceType": "Bundle", "type": "transaction", "entry": [_condition(t) for t in texts]}
+    response = requests.post(f"{BASE_URL}/fhir_resource", json=bundle)
+    print(f"\nStatus: {response.status_code}")
+    assert response.status_code == 200, response.text
+
+    for text, entry in zip(texts, response.json()["entry"]):
+        code = entry["resource"]["code"]
+        coding = code.get("coding")
+        print(f"{text!r:>16} -> {coding[0]['code'] if coding else 'uncoded'}")
+        assert code["text"] == text
+    assert response.json()["entry"][0]["resource"]["code"].get("coding"), "Fever should be coded"
+
+if __name__ == "__main__":
+    test_condition_autocoding()
@@ -0,0 +1,71 @@
+import copy
+
+from encryption_policy import ENCRYPTION_POLICY, EncryptionPolicy, parse_path
+
+PATIENT = {
+    "resourceType": "Patient",
+    "name": [{"family": "Smith", "given": ["John", "Robert"]}, {"family": "Jones"}],
+    "address": [
+        {"line": ["123 Main St", "Apt 4B"], "city": "Boston"},
+        {"line": ["9 Elm Rd"]},
+        {"city": "No lines"}
+    ],
+    "telecom": [{"system": "phone", "value": "555-0123"}, {"system": "email"}],
+    "gender": "male"
+}
+
+def mark(text):
+    return f"E({text})"
+
+def _raises_value_error(fn, *args):
+    try:
+        fn(*args)
+    except ValueError as e:
+        print(f"  rejected: {e}")
+        return True
+    return False
+
+def test_encryption_policy():
+    print("=== Encryption Policy Test ===")
+
+    # [n] selects the n-th item of every list it applies to
+    assert parse_path("address.line[0]") == [("address", None), ("line", 0)]
+    assert parse_path("name.family") == [("name", None), ("family", None)]
+
+    policy = EncryptionPolicy(ENCRYPTION_POLICY)
+    resource = copy.deepcopy(PATIENT)
+    seen = []
+    count = policy.apply(resource, mark, lambda path, value: seen.append((path, value)))
+    print(f"\nEncrypted {count} Patient fields")
+    assert resource["name"] == [{"family": "E(Smith)", "given": ["E(John)", "E(Robert)"]}, {"family": "E(Jones)"}]
+    assert [a.get("line") for a in resource["address"]] == [["E(123 Main St)", "Apt 4B"], ["E(9 Elm Rd)"], None]
+    assert resource["telecom"] == [{"system": "phone", "value": "E(555-0123)"}, {"system": "email"}]
+    assert resource["gender"] == "male" and resource["address"][0]["city"] == "Boston"
+    assert count == len(seen) == 7
+    # The observer sees every plaintext, under its policy path, before encryption
+    assert ("address.line[0]", "123 Main St") in seen and ("name.given", "Robert") in seen
+
+    # apply_by_path gives the encryptor the same path, e.g. to bind it to the ciphertext
+    resource = copy.deepcopy(PATIENT)
+    assert policy.apply_by_path(resource, lambda path, value: f"{path}({value})") == 7
+    assert resource["address"][0]["line"][0] == "address.line[0](123 Main St)"
+
+    # Observation and Condition entries of the default policy
+    observation = {"resourceType": "Observation", "valueString": "secret", "note": [{"text": "n1"}, {"text": "n2"}]}
+    assert policy.apply(observation, mark) == 3 and observation["note"][1]["text"] == "E(n2)"
+    condition = {"resourceType": "Condition", "code": {"text": "Fever"}, "note": [{"text": "private"}]}
+    assert policy.apply(condition, mark) == 1 and condition["code"]["text"] == "Fever"
+
+    # Types without a policy are untouched
+    assert not policy.covers("Encounter")
+    assert policy.apply({"resourceType": "Encounter", "note": [{"text": "x"}]}, mark) == 0
+    print("Default policy: OK")
+
+    # Invalid and overlapping paths are rejected when the policy is compiled
+    print("\nInvalid policies:")
+    assert _raises_value_error(EncryptionPolicy, {"Patient": ["na-me"]})
+    assert _raises_value_error(EncryptionPolicy, {"Patient": ["name", "name.family"]})
+    assert _raises_value_error(EncryptionPolicy, {"Patient": ["address.line[x]"]})
+
+if __name__ == "__main__":
+    test_encryption_policy()
@@ -0,0 +1,121 @@
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.keywrap import InvalidUnwrap
+
+import envelope
+from encryption_policy import EncryptionPolicy
+from envelope import (
+    KeyEncryptionKey, attach_wrapped_key, encrypt_resource, field_aad, load_or_create_key,
+    new_data_key, open_data_key, wrapped_key_of, _b64decode, _b64encode
+)
+
+def _raises(exc_type, fn, *args):
+    try:
+        fn(*args)
+    except exc_type:
+        return True
+    return False
+
+def test_envelope():
+    print("=== Envelope Encryption Test ===")
+    kek = KeyEncryptionKey(os.urandom(32))
+    data_key = new_data_key(kek)
+
+    # Round trip, including non-ASCII text; each encryption uses a fresh nonce
+    for text in ("Smith", "Rāj Kumār", "123 Main St"):
+        token = data_key.encrypt(text)
+        assert token != text and data_key.decrypt(token) == text
+    assert data_key.encrypt("Smith") != data_key.encrypt("Smith")
+    assert data_key.encrypt("") == "" and data_key.decrypt(None) is None
+    print("Round trip: OK")
+
+    # The wrapped key in resource.meta reopens the data key under the same KEK
+    resource = {"resourceType": "Patient", "meta": {"extension": [{"url": "http://example.org/other", "valueString": "x"}]}}
+    attach_wrapped_key(resource, data_key)
+    attach_wrapped_key(resource, data_key)  # attaching again replaces, never duplicates
+    assert len(resource["meta"]["extension"]) == 2
+    wrapped = wrapped_key_of(resource)
+    assert wrapped == data_key.wrapped and wrapped.startswith(kek.kid + ":")
+    reopened = open_data_key(kek, wrapped)
+    assert reopened.decrypt(data_key.encrypt("Smith")) == "Smith"
+    assert wrapped_key_of({"resourceType": "Patient"}) is None
+    print("Wrapped key extension: OK")
+
+    # A different KEK is refused by kid; a forged kid fails the key unwrap
+    other = KeyEncryptionKey(os.urandom(32))
+    assert _raises(ValueError, open_data_key, other, wrapped)
+    forged = other.kid + ":" + wrapped.partition(":")[2]
+    assert _raises(InvalidUnwrap, open_data_key, other, forged)
+    print("Wrong KEK rejected: OK")
+
+    # A wrong data key or a tampered token fails authentication
+    token = data_key.encrypt("Smith")
+    assert _raises(InvalidTag, new_data_key(kek).decrypt, token)
+    raw = bytearray(_b64decode(token))
+    raw[-1] ^= 1
+    assert _raises(InvalidTag, data_key.decrypt, _b64encode(bytes(raw)))
+    print("Wrong data key / tampered ciphertext rejected: OK")
+
+    # Data keys survive pickling, as they are sent to worker processes
+    assert pickle.loads(pickle.dumps(data_key)).decrypt(token) == "Smith"
+
+    # Policy fields are bound to their resource and path: moved ciphertexts do not decrypt
+    policy = EncryptionPolicy.from_env()
+    patient = {"resourceType": "Patient", "id": "p1", "name": [{"family": "Smith", "given": ["John"]}]}
+    used = encrypt_resource(policy, patient, kek)
+    assert used is not None and wrapped_key_of(patient) == used.wrapped
+    name = patient["name"][0]
+    assert used.decrypt(name["family"], field_aad(patient, "name.family")) == "Smith"
+    assert _raises(InvalidTag, used.decrypt, name["family"])
+    assert _raises(InvalidTag, used.decrypt, name["family"], field_aad(patient, "name.given"))
+    assert _raises(InvalidTag, used.decrypt, name["family"], field_aad({**patient, "id": "p2"}, "name.family"))
+    policy.apply_by_path(patient, open_data_key(kek, wrapped_key_of(patient)).field_decryptor(patient))
+    assert patient["name"] == [{"family": "Smith", "given": ["John"]}]
+    print("Field binding: OK")
+
+    # No data key is created, wrapped or attached for a resource with nothing to encrypt
+    created = []
+    original = envelope.new_data_key
+    envelope.new_data_key = lambda k: created.append(k) or original(k)
+    try:
+        observation = {"resourceType": "Observation", "id": "o1", "status": "final"}
+        assert encrypt_resource(policy, observation, kek) is None
+        assert created == [] and "meta" not in observation
+        assert encrypt_resource(policy, {"resourceType": "Observation", "id": "o2", "valueString": "x"}, kek)
+        assert len(created) == 1
+    finally:
+        envelope.new_data_key = original
+    print("Lazy data key: OK")
+
+    # The key file is created once, mode 0600, and read back on the next start
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "kek.key"
+        first = load_or_create_key("ENVELOPE_TEST_UNSET", path)
+        assert load_or_create_key("ENVELOPE_TEST_UNSET", path) == first
+        assert os.listdir(tmp) == ["kek.key"]
+        if os.name == "posix":
+            assert path.stat().st_mode & 0o777 == 0o600
+
+    # Without hard links the key file is created exclusively instead
+    def no_link(src, dst):
+        raise PermissionError("hard links not supported")
+    original = envelope.os.link
+    envelope.os.link = no_link
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "kek.key"
+            first = load_or_create_key("ENVELOPE_TEST_UNSET", path)
+            assert len(first) == 32 and os.listdir(tmp) == ["kek.key"]
+            assert load_or_create_key("ENVELOPE_TEST_UNSET", path) == first
+            # A process losing the O_EXCL race reads the winner's key
+            assert envelope._create_key_file(path, os.urandom(32)) == first
+    finally:
+        envelope.os.link = original
+    print("Key file: OK")
+
+if __name__ == "__main__":
+    test_envelope()
@@ -0,0 +1,62 @@
+import requests
+import json
+import uuid
+
+BASE_URL = "http://127.0.0.1:8000"
+
+def _bundle():
+    patient_url = f"urn:uuid:{uuid.uuid4()}"
+    observation_url = f"urn:uuid:{uuid.uuid4()}"
+    return patient_url, observation_url, {
+        "resourceType": "Bundle",
+        "type": "transaction",
+        "entry": [
+            {
+                "fullUrl": patient_url,
+                "resource": {
+                    "resourceType": "Patient",
+                    "name": [{"family": "Export", "given": ["Test"]}],
+                    "gender": "male",
+                    "birthDate": "1975-07-07"
+                },
+                "request": {"method": "POST", "url": "Patient"}
+            },
+            {
+                "fullUrl": observation_url,
+                "resource": {
+                    "resourceType": "Observation",
+                    "status": "final",
+                    "code": {"coding": [{"system": "http://loinc.org", "code": "8480-6"}]},
+                    "subject": {"reference": patient_url},
+                    "performer": [{"reference": patient_url}],
+                    "effectiveDateTime": "2025-09-20T15:30:00Z",
+                    "valueQuantity": {"value": 120, "unit": "mmHg"}
+                },
+                "request": {"method": "POST", "url": "Observation"}
+            }
+        ]
+    }
+
+def test_export():
+    print("Testing bulk export of stored resources...")
+
+    patient_url, observation_url, bundle = _bundle()
+    response = requests.post(f"{BASE_URL}/fhir_resource", json=bundle)
+    assert response.status_code == 200, response.text
+    patient_location, observation_location = (e["response"]["location"] for e in response.json()["entry"])
+
+    # Every reference to a bundle fullUrl is stored as the resolved Type/id, not only subject
+    lines = requests.get(f"{BASE_URL}/$export", params={"_type": "Observation"}).text.splitlines()
+    exported = [json.loads(line) for line in lines]
+    observation = next(r for r in exported if f"Observation/{r['id']}" == observation_location)
+    print(f"\nsubject: {observation['subject']}, performer: {observation['performer']}")
+    assert observation["subject"] == {"reference": patient_location}
+    assert observation["performer"] == [{"reference": patient_location}]
+    assert patient_url not in json.dumps(observation)
+
+    # The referenced Patient is exported too, so the reference does not dangle
+    lines = requests.get(f"{BASE_URL}/$export", params={"_type": "Patient"}).text.splitlines()
+    assert patient_location in {f"Patient/{json.loads(line)['id']}" for line in lines}
+
+if __name__ == "__main__":
+    test_export()
@@ -0,0 +1,84 @@
+import requests
+import json
+import uuid
+
+BASE_URL = "http://127.0.0.1:8000"
+
+def _patient_entry(i):
+    return {
+        "fullUrl": f"urn:uuid:{uuid.uuid4()}",
+        "resource": {
+            "resourceType": "Patient",
+            "name": [{"family": f"Stream{i}", "given": ["Test"]}],
+            "gender": "female",
+            "birthDate": "1985-05-05"
+        },
+        "request": {"method": "POST", "url": "Patient"}
+    }
+
+def _post_stream(body: bytes, chunk_size: int = 64, **kwargs):
+    # Sent as a generator so the request body is chunked, like a real upload
+    def chunks():
+        for i in range(0, len(body), chunk_size):
+            yield body[i:i + chunk_size]
+    return requests.post(
+        f"{BASE_URL}/fhir_resource/stream",
+        data=chunks(),
+        headers={"Content-Type": "application/json"},
+        **kwargs
+    )
+
+def test_fhir_stream():
+    print("Testing streaming bundle endpoint...")
+
+    # resourceType and type before entry: entries are processed as they arrive
+    bundle = {"resourceType": "Bundle", "type": "transaction", "entry": [_patient_entry(i) for i in range(5)]}
+    response = _post_stream(json.dumps(bundle).encode())
+    print(f"\nIn-order bundle status: {response.status_code}")
+    statuses = [e["response"]["status"] for e in response.json()["entry"]]
+    print(statuses)
+    assert response.status_code == 200
+    assert len(statuses) == 5 and all(s.startswith("201") for s in statuses)
+
+    # entry before resourceType/type cannot be streamed and is rejected, not buffered
+    reordered = json.dumps({"entry": bundle["entry"], "resourceType": "Bundle", "type": "transaction"})
+    response = _post_stream(reordered.encode())
+    print(f"\nentry-first bundle status: {response.status_code} {response.json()}")
+    assert response.status_code == 400
+
+    # Every entry must be an object; strings, numbers and null are rejected, not skipped
+    for bad in ('"x"', "12", "null", "[1]"):
+        body = '{"resourceType":"Bundle","type":"transaction","entry":[' + bad + "]}"
+        response = _post_stream(body.encode())
+        print(f"Entry {bad}: {response.status_code} {response.json()}")
+        assert response.status_code == 400
+
+    # A multi-MB body arrives in many messages, all of which must reach the parser
+    count = 10000
+    bundle = {"resourceType": "Bundle", "type": "transaction", "entry": [_patient_entry(i) for i in range(count)]}
+    body = json.dumps(bundle).encode()
+    response = _post_stream(body, 64 * 1024, params={"_summary": "true"}, timeout=120)
+    print(f"\n{len(body) / 1e6:.1f} MB bundle status: {response.status_code}")
+    assert response.status_code == 200
+    assert len(response.json()["entry"]) == count
+
+    # Batches are committed as they are processed: a structural error after streaming
+    # has started ends the response with a 400 entry, and the entries before it stay stored
+    prefix = [_patient_entry(i) for i in range(2000)]
+    body = json.dumps({"resourceType": "Bundle", "type": "transaction", "entry": prefix})
+    body = body[:-2] + ', "x"]}'
+    response = _post_stream(body.encode(), 64 * 1024)
+    entries = response.json()["entry"]
+    print(f"\nPartially invalid bundle: {response.status_code}, last entry {entries[-1]['response']['status']}")
+    assert response.status_code == 200
+    assert len(entries) == len(prefix) + 1
+    assert entries[-1]["response"]["status"] == "400 Bad Request"
+    assert entries[-1]["response"]["outcome"]["issue"][0]["code"] == "structure"
+    locations = {e["response"]["location"] for e in entries[:-1]}
+    exported = requests.get(f"{BASE_URL}/$export", params={"_type": "Patient"}).text.splitlines()
+    stored = {f"Patient/{json.loads(line)['id']}" for line in exported}
+    print(f"Stored from the valid prefix: {len(locations & stored)}")
+    assert locations <= stored
+
+if __name__ == "__main__":
+    test_fhir_stream()
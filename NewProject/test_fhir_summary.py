@@ -0,0 +1,39 @@
+from fhir_summary import ResponseShape
+
+PATIENT = {
+    "resourceType": "Patient",
+    "id": "p1",
+    "name": [{"family": "Smith", "given": ["John"]}],
+    "gender": "male",
+    "birthDate": "1970-01-01"
+}
+
+def _raises_value_error(fn, *args):
+    try:
+        fn(*args)
+    except ValueError as e:
+        print(f"  rejected: {e}")
+        return True
+    return False
+
+def test_fhir_summary():
+    print("=== Response Shape Test ===")
+
+    # A resource-type prefix is dropped; the element itself is kept whole
+    for elements in ("name,gender", "Patient.name,Patient.gender", " name , Patient.gender "):
+        shape = ResponseShape(elements=elements)
+        view = shape.resource_view(PATIENT)
+        print(f"\n_elements={elements!r}: {sorted(view)}")
+        assert shape.elements == {"name", "gender"}
+        assert view["name"] == PATIENT["name"] and "birthDate" not in view
+
+    # Deeper paths would otherwise be reduced to their last segment ("given") and
+    # silently drop the element asked for
+    print("\nDeeper paths:")
+    assert _raises_value_error(ResponseShape, None, "Patient.name.given")
+    assert _raises_value_error(ResponseShape, None, "name.given")
+    assert _raises_value_error(ResponseShape, None, "Patient.")
+    assert _raises_value_error(ResponseShape, "true", "name")
+
+if __name__ == "__main__":
+    test_fhir_summary()
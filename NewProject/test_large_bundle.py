@@ -0,0 +1,51 @@
+import os
+import requests
+import uuid
+
+# Targets simple_app.py, which spreads large bundles over worker processes and fails
+# the whole bundle on a bad entry (app.py reports unsupported types per entry instead).
+BASE_URL = os.getenv("SIMPLE_APP_URL", "http://127.0.0.1:8000")
+
+# At or above this many entries the server spreads a bundle over worker processes
+# (FHIR_PARALLEL_MIN_ENTRIES, see entry_pool.py); run the server with FHIR_WORKERS > 1.
+ENTRIES = int(os.getenv("FHIR_PARALLEL_MIN_ENTRIES", "256")) + 10
+
+def _patient_entry():
+    return {
+        "fullUrl": f"urn:uuid:{uuid.uuid4()}",
+        "resource": {
+            "resourceType": "Patient",
+            "name": [{"family": "Large", "given": ["Bundle"]}],
+            "gender": "other",
+            "birthDate": "2000-01-01"
+        },
+        "request": {"method": "POST", "url": "Patient"}
+    }
+
+def _bundle(entries):
+    return {"resourceType": "Bundle", "type": "transaction", "entry": entries}
+
+def test_large_bundle():
+    print(f"Testing a {ENTRIES}-entry bundle...")
+
+    response = requests.post(f"{BASE_URL}/fhir_resource", json=_bundle([_patient_entry() for _ in range(ENTRIES)]))
+    print(f"\nValid bundle status: {response.status_code}")
+    assert response.status_code == 200
+    assert len(response.json()["entry"]) == ENTRIES
+
+    # One invalid Patient deep in the bundle: the worker's error must come back as 422
+    entries = [_patient_entry() for _ in range(ENTRIES)]
+    del entries[ENTRIES - 3]["resource"]["birthDate"]
+    response = requests.post(f"{BASE_URL}/fhir_resource", json=_bundle(entries))
+    print(f"Invalid Patient status: {response.status_code} {response.json()['detail'][:60]}")
+    assert response.status_code == 422
+
+    # An unsupported resource type fails the bundle with a 400
+    entries = [_patient_entry() for _ in range(ENTRIES)]
+    entries[ENTRIES // 2]["resource"] = {"resourceType": "Encounter", "status": "finished"}
+    response = requests.post(f"{BASE_URL}/fhir_resource", json=_bundle(entries))
+    print(f"Unsupported type status: {response.status_code} {response.json()['detail']}")
+    assert response.status_code == 400
+
+if __name__ == "__main__":
+    test_large_bundle()